@@ -0,0 +1,133 @@
+"""
+Response compression with gzip/brotli negotiation.
+
+Only JSON and text/calendar bodies above a size threshold are compressed;
+responses that already carry a Content-Encoding or opt out with
+Cache-Control: no-transform (feeds, which negotiate their own pre-rendered
+encodings and ETags) pass through untouched. Brotli is used when the client prefers it; without the
+`brotli` package (a declared dependency) everything falls back to gzip.
+"""
+from __future__ import annotations
+import gzip
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/calendar")
+DEFAULT_MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # good ratio while staying cheap enough for per-request use
+
+
+def _parse_accept_encoding(header: str) -> List[Tuple[str, float]]:
+    out: List[Tuple[str, float]] = []
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out.append((coding, q))
+    return out
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, preferring br on ties."""
+    offers = dict(_parse_accept_encoding(accept_encoding or ""))
+    wildcard = offers.get("*", 0.0)
+    candidates = []
+    if brotli is not None:
+        candidates.append(("br", offers.get("br", wildcard)))
+    candidates.append(("gzip", offers.get("gzip", wildcard)))
+    best, q = max(candidates, key=lambda c: c[1])  # max() keeps the first on ties
+    return best if q > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware. Compressible responses are buffered in full, which
+    is fine for the bounded JSON/ICS bodies this API returns.
+    """
+
+    def __init__(self, app, minimum_size: int = DEFAULT_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        encoding = choose_encoding(headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                response_headers = {
+                    k.decode("latin-1").lower(): v.decode("latin-1") for k, v in message["headers"]
+                }
+                content_type = response_headers.get("content-type", "")
+                if (
+                    message["status"] in (204, 304)
+                    or "content-encoding" in response_headers
+                    or "no-transform" in response_headers.get("cache-control", "").lower()
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            out_headers = [
+                (k, v) for k, v in start_message["headers"]
+                if k.lower() not in (b"content-length", b"vary")
+            ]
+            vary = [
+                s.strip()
+                for k, v in start_message["headers"] if k.lower() == b"vary"
+                for s in v.decode("latin-1").split(",") if s.strip()
+            ]
+            if "accept-encoding" not in (s.lower() for s in vary):
+                vary.append("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                out_headers.append((b"content-encoding", encoding.encode("latin-1")))
+            out_headers.append((b"vary", ", ".join(vary).encode("latin-1")))
+            out_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+            await send({**start_message, "headers": out_headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,73 @@
+"""
+Turn raw model output into an ExtractResponse. Shared by the synchronous
+/extract-gemini route and the background job workers.
+"""
+from __future__ import annotations
+import os
+from datetime import date
+from typing import List, Optional
+
+from .schema import EventRow, ExtractResponse
+from .parser import from_gemini_json
+from .build_calendar import infer_range
+
+
+def resolve_timezone(tz_name: Optional[str]) -> str:
+    return tz_name or os.environ.get("DEFAULT_TIMEZONE") or "UTC"
+
+
+def apply_global_dates(
+    events: List[EventRow],
+    start: Optional[date],
+    end: Optional[date],
+) -> List[EventRow]:
+    updated: List[EventRow] = []
+    for ev in events:
+        updates = {}
+        if start and ev.start_date is None:
+            updates["start_date"] = start
+        if end and ev.end_date is None:
+            updates["end_date"] = end
+        updated.append(ev if not updates else ev.model_copy(update=updates))
+    return updated
+
+
+def build_extract_response(
+    raw,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    timezone: Optional[str],
+) -> ExtractResponse:
+    events = from_gemini_json(raw)
+    tz = resolve_timezone(timezone)
+
+    events = apply_global_dates(events, start_date, end_date)
+
+    has_start = bool(start_date) or any(ev.start_date for ev in events)
+    has_end = bool(end_date) or any(ev.end_date for ev in events)
+    needs_dates = not (has_start and has_end)
+
+    inferred_start = None
+    inferred_end = None
+    if start_date or end_date:
+        inferred_start, inferred_end, _ = infer_range(start_date, end_date, tz)
+    else:
+        event_starts = [ev.start_date for ev in events if ev.start_date]
+        event_ends = [ev.end_date for ev in events if ev.end_date]
+        if event_starts:
+            inferred_start = min(event_starts)
+        if event_ends:
+            inferred_end = max(event_ends)
+
+    note = None
+    if needs_dates:
+        note = "Add the term's start and end dates before exporting to calendar."
+
+    return ExtractResponse(
+        events=events,
+        timezone=tz,
+        inferred_start=inferred_start,
+        inferred_end=inferred_end,
+        needs_dates=needs_dates,
+        note=note,
+    )
@@ -0,0 +1,179 @@
+"""
+Saved schedules served as subscribable calendar feeds (/feeds/{id}.ics).
+
+A feed is rendered once when it is saved: the ICS bytes and a gzip copy are
+stored next to the request in SQLite. Calendar clients poll feeds often, so
+GETs are answered from a small per-process cache with ETag/Last-Modified
+revalidation and never re-render.
+
+The feed id is the public subscription URL, so edits need a separate edit
+token. It is returned once on creation and only its SHA-256 is stored.
+"""
+from __future__ import annotations
+import gzip
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .storage import connect, data_dir, init_database
+
+DEFAULT_CACHE_TTL = 30.0  # how stale another worker's edit may look, in seconds
+CACHE_MAX_ENTRIES = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feeds (
+    id         TEXT PRIMARY KEY,
+    request    TEXT NOT NULL,
+    ics        BLOB NOT NULL,
+    ics_gz     BLOB NOT NULL,
+    etag       TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    state      TEXT,
+    token_hash TEXT
+);
+"""
+
+
+@dataclass(frozen=True)
+class Feed:
+    id: str
+    request: str     # ICSRequest JSON the feed was rendered from
+    ics: bytes
+    ics_gz: bytes
+    etag: str        # quoted strong validator of the identity body
+    updated_at: float
+    state: Optional[str] = None       # ExportState JSON: keeps UIDs stable across edits
+    token_hash: Optional[str] = None  # SHA-256 of the edit token
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.updated_at, usegmt=True)
+
+    @property
+    def gzip_etag(self) -> str:
+        # Each representation needs its own validator.
+        return self.etag[:-1] + '-gz"'
+
+
+def new_feed_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def new_edit_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_matches(feed: Feed, token: Optional[str]) -> bool:
+    if not token or not feed.token_hash:
+        return False
+    return hmac.compare_digest(hash_token(token), feed.token_hash)
+
+
+class FeedStore:
+    def __init__(self, path: Optional[Path] = None, cache_ttl: float = DEFAULT_CACHE_TTL):
+        self.path = Path(path) if path else data_dir() / "feeds.sqlite3"
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[str, Tuple[float, Optional[Feed]]] = {}
+        init_database(self.path, _SCHEMA)
+
+    def save(
+        self,
+        feed_id: str,
+        request_json: str,
+        ics: bytes,
+        state_json: Optional[str] = None,
+        token_hash: Optional[str] = None,
+    ) -> Feed:
+        # mtime=0 keeps the gzip bytes (and so their ETag) deterministic.
+        feed = Feed(
+            id=feed_id,
+            request=request_json,
+            ics=ics,
+            ics_gz=gzip.compress(ics, compresslevel=9, mtime=0),
+            etag='"' + hashlib.sha256(ics).hexdigest()[:32] + '"',
+            updated_at=float(int(time.time())),  # HTTP dates have 1s resolution
+            state=state_json,
+            token_hash=token_hash,
+        )
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO feeds"
+                " (id, request, ics, ics_gz, etag, updated_at, state, token_hash)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    feed.id, feed.request, feed.ics, feed.ics_gz, feed.etag,
+                    feed.updated_at, feed.state, feed.token_hash,
+                ),
+            )
+        self._remember(feed_id, feed)
+        return feed
+
+    def _remember(self, feed_id: str, feed: Optional[Feed]) -> None:
+        self._cache.pop(feed_id, None)
+        self._cache[feed_id] = (time.monotonic(), feed)
+        if len(self._cache) > CACHE_MAX_ENTRIES:
+            del self._cache[next(iter(self._cache))]
+
+    def get(self, feed_id: str, fresh: bool = False) -> Optional[Feed]:
+        """Cached for polls; `fresh=True` (edits) always reads the database."""
+        hit = None if fresh else self._cache.get(feed_id)
+        if hit is not None and time.monotonic() - hit[0] < self.cache_ttl:
+            return hit[1]
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT id, request, ics, ics_gz, etag, updated_at, state, token_hash"
+                " FROM feeds WHERE id = ?",
+                (feed_id,),
+            ).fetchone()
+        feed = Feed(*row) if row else None
+        # Misses are cached too, so polling a deleted feed stays cheap.
+        self._remember(feed_id, feed)
+        return feed
+
+    def delete(self, feed_id: str) -> bool:
+        with connect(self.path) as conn:
+            cur = conn.execute("DELETE FROM feeds WHERE id = ?", (feed_id,))
+        self._cache.pop(feed_id, None)
+        return cur.rowcount > 0
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "x-gzip"):
+            q = params.strip()
+            return not (q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"))
+    return False
+
+
+def not_modified(feed: Feed, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """RFC 9110 conditional GET: If-None-Match wins over If-Modified-Since."""
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or feed.etag in tags or feed.gzip_etag in tags
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return feed.updated_at <= since
+    return False
+
+
+_store: Optional[FeedStore] = None
+
+def get_store() -> FeedStore:
+    global _store
+    if _store is None:
+        _store = FeedStore(cache_ttl=float(os.getenv("FEED_CACHE_TTL") or DEFAULT_CACHE_TTL))
+    return _store
@@ -1,19 +1,42 @@
 """
-Optional helpers for Google Calendar integration if you decide to move
-OAuth/token storage server-side. Not required for the MVP since the
-frontend can call Google APIs directly after OAuth.
+Helpers for Google Calendar integration. The frontend can still call Google
+APIs directly after OAuth; app.google_sync uses these payloads for the
+server-side incremental sync.
 """
+from datetime import date, datetime, timedelta
 from typing import Dict, Any
 
+import pytz
+
+from .schema import DAY_CODE_TO_INDEX
+
+def _first_meeting(start: date, days) -> date:
+    """First date on/after start that falls on one of the BYDAY codes."""
+    weekdays = [DAY_CODE_TO_INDEX[d] for d in days if d in DAY_CODE_TO_INDEX]
+    if not weekdays:
+        return start
+    return start + timedelta(days=min((w - start.weekday()) % 7 for w in weekdays))
+
 def build_google_event(ev: Dict[str, Any], timezone: str) -> Dict[str, Any]:
     """
     Convert our event row into a Google Calendar 'events.insert' payload.
     Assumes ev has start_date/end_date/start_time/end_time/days.
+    The first instance is anchored on the first meeting day, not on
+    start_date itself, otherwise Google adds a stray occurrence there.
     """
     byday = ",".join(ev.get("days", []))
-    start_dt = f"{ev['start_date']}T{ev['start_time']}:00"
-    end_dt = f"{ev['start_date']}T{ev['end_time']}:00"
-    until = ev['end_date'].replace("-", "") + "T235959Z"
+    first = _first_meeting(date.fromisoformat(str(ev["start_date"])), ev.get("days", []))
+    start_dt = f"{first.isoformat()}T{ev['start_time']}:00"
+    end_dt = f"{first.isoformat()}T{ev['end_time']}:00"
+    # RFC 5545: with a zoned DTSTART, UNTIL is UTC. End of the last day is
+    # local 23:59:59, which west of UTC already falls on the next UTC day.
+    last = date.fromisoformat(str(ev["end_date"]))
+    until = (
+        pytz.timezone(timezone)
+        .localize(datetime(last.year, last.month, last.day, 23, 59, 59))
+        .astimezone(pytz.utc)
+        .strftime("%Y%m%dT%H%M%SZ")
+    )
 
     body = {
         "summary": ev.get("title", "Class"),
@@ -0,0 +1,258 @@
+"""
+Server-side incremental sync of EventRows into a Google Calendar.
+
+Each row gets a stable Google event id derived from its identity
+(schema.row_keys), and we remember a digest of what we last sent for it.
+A re-sync only sends the rows that were created, changed or removed since
+then, packed into Calendar batch requests over one keep-alive session.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+from .google import build_google_event
+from .schema import EventRow, row_keys
+from .storage import data_dir
+
+GOOGLE_API_BASE = "https://www.googleapis.com"
+BATCH_LIMIT = 50  # Calendar API maximum calls per batch request
+
+# Sync state: google event id -> digest of the payload last sent for it.
+SyncState = Dict[str, str]
+
+
+def external_id(scope: str, row_key: str) -> str:
+    # Google event ids must be base32hex ([a-v0-9]); hex digits qualify.
+    return "sc" + hashlib.sha1(f"{scope}\n{row_key}".encode("utf-8")).hexdigest()
+
+
+def _digest(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Operation:
+    kind: str  # "create" | "update" | "delete"
+    event_id: str
+    body: Optional[Dict[str, Any]] = None
+    digest: Optional[str] = None
+
+
+@dataclass
+class SyncResult:
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    errors: List[str] = field(default_factory=list)
+    state: SyncState = field(default_factory=dict)
+
+
+def plan_sync(
+    events: List[EventRow],
+    timezone: str,
+    previous: SyncState,
+    scope: str,
+) -> Tuple[List[Operation], int]:
+    """Diff rows against the last synced state. Returns (operations, unchanged)."""
+    ops: List[Operation] = []
+    unchanged = 0
+    current: Dict[str, Tuple[Dict[str, Any], str]] = {}
+    for key, ev in zip(row_keys(events), events):
+        if not ev.days:
+            continue  # no weekdays -> no valid RRULE; the .ics export skips these too
+        body = build_google_event(ev.model_dump(mode="json"), timezone)
+        event_id = external_id(scope, key)
+        body["id"] = event_id
+        current[event_id] = (body, _digest(body))
+
+    for event_id, (body, digest) in current.items():
+        if event_id not in previous:
+            ops.append(Operation("create", event_id, body, digest))
+        elif previous[event_id] != digest:
+            ops.append(Operation("update", event_id, body, digest))
+        else:
+            unchanged += 1
+    for event_id in previous:
+        if event_id not in current:
+            ops.append(Operation("delete", event_id))
+    return ops, unchanged
+
+
+class GoogleCalendarClient:
+    """Minimal Calendar v3 client that only speaks batch requests."""
+
+    def __init__(
+        self,
+        access_token: str,
+        calendar_id: str = "primary",
+        base_url: str = GOOGLE_API_BASE,
+        session: Optional[requests.Session] = None,
+        timeout: float = 30.0,
+    ):
+        self.access_token = access_token
+        self.calendar_id = calendar_id
+        self.base_url = base_url.rstrip("/")
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def calendar_identity(self) -> str:
+        """
+        Canonical id of the target calendar as Google reports it for this
+        token ("primary" resolves to the owner's email). Sync state is keyed
+        by this rather than by anything the caller claims.
+        """
+        resp = self.session.get(
+            f"{self.base_url}/calendar/v3/calendars/{quote(self.calendar_id, safe='')}",
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    def _path(self, op: Operation) -> Tuple[str, str]:
+        events = f"/calendar/v3/calendars/{quote(self.calendar_id, safe='')}/events"
+        if op.kind == "create":
+            return "POST", events
+        if op.kind == "update":
+            return "PUT", f"{events}/{op.event_id}"
+        return "DELETE", f"{events}/{op.event_id}"
+
+    def batch(self, ops: List[Operation]) -> List[int]:
+        """Send ops in batch requests; returns the HTTP status for each op."""
+        statuses: List[int] = []
+        for start in range(0, len(ops), BATCH_LIMIT):
+            statuses.extend(self._send_batch(ops[start:start + BATCH_LIMIT]))
+        return statuses
+
+    def _send_batch(self, ops: List[Operation]) -> List[int]:
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for i, op in enumerate(ops):
+            method, path = self._path(op)
+            inner = f"{method} {path} HTTP/1.1\r\n"
+            if op.body is not None:
+                inner += "Content-Type: application/json\r\n\r\n" + json.dumps(op.body)
+            else:
+                inner += "\r\n"
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <item{i}>\r\n\r\n"
+                f"{inner}\r\n"
+            )
+        body = "".join(parts) + f"--{boundary}--\r\n"
+        resp = self.session.post(
+            f"{self.base_url}/batch/calendar/v3",
+            data=body.encode("utf-8"),
+            headers={
+                "Authorization": f"Bearer {self.access_token}",
+                "Content-Type": f"multipart/mixed; boundary={boundary}",
+            },
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        by_id = parse_batch_response(resp.headers.get("Content-Type", ""), resp.content)
+        return [by_id.get(f"item{i}", 0) for i in range(len(ops))]
+
+
+def parse_batch_response(content_type: str, body: bytes) -> Dict[str, int]:
+    """Map each part's Content-ID (without the 'response-' prefix) to its status."""
+    marker = "boundary="
+    if marker not in content_type:
+        raise ValueError("Batch response is missing a multipart boundary.")
+    boundary = content_type.split(marker, 1)[1].split(";")[0].strip().strip('"')
+    statuses: Dict[str, int] = {}
+    for chunk in body.decode("utf-8").split(f"--{boundary}"):
+        chunk = chunk.strip()
+        if not chunk or chunk == "--":
+            continue
+        headers, _, inner = chunk.partition("\r\n\r\n")
+        content_id = None
+        for line in headers.splitlines():
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-id":
+                content_id = value.strip().strip("<>")
+        status_line = inner.lstrip().split("\r\n", 1)[0]
+        if content_id is None or not status_line.startswith("HTTP/"):
+            continue
+        if content_id.startswith("response-"):
+            content_id = content_id[len("response-"):]
+        statuses[content_id] = int(status_line.split()[1])
+    return statuses
+
+
+def sync_events(
+    client: GoogleCalendarClient,
+    events: List[EventRow],
+    timezone: str,
+    previous: SyncState,
+    scope: str,
+) -> SyncResult:
+    ops, unchanged = plan_sync(events, timezone, previous, scope)
+    result = SyncResult(unchanged=unchanged, state=dict(previous))
+
+    # Two rounds at most: the second repairs drift between our state and the
+    # calendar (create hit an existing id -> update; update hit a deleted
+    # event -> create).
+    for _ in range(2):
+        if not ops:
+            break
+        retry: List[Operation] = []
+        for op, status in zip(ops, client.batch(ops)):
+            ok = 200 <= status < 300
+            if op.kind == "delete" and (ok or status in (404, 410)):
+                result.state.pop(op.event_id, None)
+                result.deleted += 1
+            elif ok:
+                result.state[op.event_id] = op.digest
+                if op.kind == "create":
+                    result.created += 1
+                else:
+                    result.updated += 1
+            elif op.kind == "create" and status == 409:
+                retry.append(Operation("update", op.event_id, op.body, op.digest))
+            elif op.kind == "update" and status in (404, 410):
+                retry.append(Operation("create", op.event_id, op.body, op.digest))
+            else:
+                result.errors.append(f"{op.kind} {op.event_id}: HTTP {status}")
+        ops = retry
+    for op in ops:
+        result.errors.append(f"{op.kind} {op.event_id}: still conflicting after retry")
+    return result
+
+
+class SyncStateStore:
+    """Last-synced state per calendar, as small JSON files."""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory) if directory else data_dir("google_sync")
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, scope: str) -> Path:
+        return self.directory / f"{hashlib.sha256(scope.encode('utf-8')).hexdigest()}.json"
+
+    def load(self, scope: str) -> SyncState:
+        try:
+            return json.loads(self._path(scope).read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self, scope: str, state: SyncState) -> None:
+        path = self._path(scope)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(state, sort_keys=True))
+        os.replace(tmp, path)
+
+
+def sync_scope(client: GoogleCalendarClient) -> str:
+    """Scope for sync state and event ids, verified against the token."""
+    return client.calendar_identity()
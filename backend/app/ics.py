@@ -1,12 +1,14 @@
 from __future__ import annotations
+from dataclasses import dataclass
 from datetime import datetime, timedelta, date
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from uuid import uuid4
+import hashlib
 import pytz
 from icalendar import Calendar, Event
 from dateutil.rrule import rrule, WEEKLY
 
-from .schema import EventRow, DAY_CODE_TO_INDEX
+from .schema import EventRow, DAY_CODE_TO_INDEX, ExportState, ExportedEvent, row_keys
 
 def _first_occurrence_on_or_after(start_date: date, weekday: int) -> date:
     """Return the date of the first given weekday on/after start_date."""
@@ -17,21 +19,14 @@ def _parse_hhmm(s: str) -> tuple[int, int]:
     h, m = s.split(":")
     return int(h), int(m)
 
-def build_ics(
+def _plan_events(
     events: List[EventRow],
-    tz_name: str,
+    tz,
     start_date: date,
     end_date: date,
-    calendar_name: str = "Class Schedule",
-) -> bytes:
-    tz = pytz.timezone(tz_name)
-    cal = Calendar()
-    cal.add("prodid", "-//Schedulify Class Sync//")
-    cal.add("version", "2.0")
-    cal.add("X-WR-CALNAME", calendar_name)
-    cal.add("X-WR-TIMEZONE", tz_name)
-
-    for row in events:
+) -> Iterator[Tuple[int, str, datetime, datetime, datetime]]:
+    """Yield (row index, day code, dtstart, dtend, until) per weekly VEVENT."""
+    for idx, row in enumerate(events):
         if not row.days:
             continue
 
@@ -57,28 +52,173 @@ def build_ics(
 
             dtstart = tz.localize(datetime(first.year, first.month, first.day, sh, sm))
             dtend = tz.localize(datetime(first.year, first.month, first.day, eh, em))
-
-            ev = Event()
-            ev.add("uid", f"{uuid4()}@schedulify")
-            ev.add("dtstamp", datetime.utcnow())
-            ev.add("summary", row.title or "Class")
-            if row.location:
-                ev.add("location", row.location)
-            desc = []
-            if row.instructor:
-                desc.append(f"Instructor: {row.instructor}")
-            if row.notes:
-                desc.append(row.notes)
-            if row.termLabel:
-                desc.append(f"Term: {row.termLabel}")
-            if desc:
-                ev.add("description", "\n".join(desc))
-            ev.add("dtstart", dtstart)
-            ev.add("dtend", dtend)
             until_dt = tz.localize(
                 datetime(event_end.year, event_end.month, event_end.day, 23, 59, 59)
             ).astimezone(pytz.utc)
-            ev.add("rrule", {"freq": "weekly", "byday": code, "until": until_dt})
-            cal.add_component(ev)
+            yield idx, code, dtstart, dtend, until_dt
+
+def _description(row: EventRow) -> Optional[str]:
+    desc = []
+    if row.instructor:
+        desc.append(f"Instructor: {row.instructor}")
+    if row.notes:
+        desc.append(row.notes)
+    if row.termLabel:
+        desc.append(f"Term: {row.termLabel}")
+    return "\n".join(desc) if desc else None
+
+def _make_vevent(
+    row: EventRow,
+    code: str,
+    dtstart: datetime,
+    dtend: datetime,
+    until_dt: datetime,
+    uid: str,
+) -> Event:
+    ev = Event()
+    ev.add("uid", uid)
+    ev.add("dtstamp", datetime.utcnow())
+    ev.add("summary", row.title or "Class")
+    if row.location:
+        ev.add("location", row.location)
+    desc = _description(row)
+    if desc:
+        ev.add("description", desc)
+    ev.add("dtstart", dtstart)
+    ev.add("dtend", dtend)
+    ev.add("rrule", {"freq": "weekly", "byday": code, "until": until_dt})
+    return ev
+
+def _new_calendar(tz_name: str, calendar_name: str, method: Optional[str] = None) -> Calendar:
+    cal = Calendar()
+    cal.add("prodid", "-//Schedulify Class Sync//")
+    cal.add("version", "2.0")
+    if method:
+        cal.add("method", method)
+    cal.add("X-WR-CALNAME", calendar_name)
+    cal.add("X-WR-TIMEZONE", tz_name)
+    return cal
 
+def build_ics(
+    events: List[EventRow],
+    tz_name: str,
+    start_date: date,
+    end_date: date,
+    calendar_name: str = "Class Schedule",
+) -> bytes:
+    tz = pytz.timezone(tz_name)
+    cal = _new_calendar(tz_name, calendar_name)
+    for idx, code, dtstart, dtend, until_dt in _plan_events(events, tz, start_date, end_date):
+        cal.add_component(
+            _make_vevent(events[idx], code, dtstart, dtend, until_dt, f"{uuid4()}@schedulify")
+        )
     return cal.to_ical()
+
+
+# ---- Incremental updates ----
+# Instead of a fresh full export (new UIDs -> duplicate events in calendar
+# apps), compare against the state returned by the previous export and emit
+# only new/changed VEVENTs with a bumped SEQUENCE, plus a METHOD:CANCEL
+# calendar for removed ones. UIDs derive from the row identity, so they
+# survive edits.
+
+@dataclass
+class ICSUpdate:
+    ics: bytes
+    state: ExportState
+    created: int = 0
+    updated: int = 0
+    cancelled: int = 0
+    unchanged: int = 0
+
+def _stable_uid(namespace: str, row_key: str, code: str) -> str:
+    digest = hashlib.sha1(f"{namespace}\n{row_key}\n{code}".encode("utf-8")).hexdigest()
+    return f"{digest}@schedulify"
+
+def _content_digest(row: EventRow, dtstart: datetime, dtend: datetime, until_dt: datetime) -> str:
+    parts = [
+        row.title or "Class",
+        row.location or "",
+        _description(row) or "",
+        dtstart.isoformat(),
+        dtend.isoformat(),
+        until_dt.isoformat(),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def build_ics_update(
+    events: List[EventRow],
+    tz_name: str,
+    start_date: date,
+    end_date: date,
+    previous: Optional[ExportState] = None,
+    calendar_name: str = "Class Schedule",
+    full: bool = False,
+) -> ICSUpdate:
+    """
+    Without `previous` this is a full export with stable UIDs; with it, only
+    the delta. Either way the returned state feeds the next update.
+
+    `full=True` renders the whole calendar (no METHOD) on every call, for
+    subscription feeds: unchanged events keep their UID and SEQUENCE and
+    removed ones simply drop out instead of being cancelled.
+    """
+    tz = pytz.timezone(tz_name)
+    namespace = previous.namespace if previous else uuid4().hex
+    before: Dict[str, ExportedEvent] = {e.uid: e for e in previous.events} if previous else {}
+    keys = row_keys(events)
+
+    cal = _new_calendar(tz_name, calendar_name, method=None if full else "PUBLISH")
+    result = ICSUpdate(ics=b"", state=ExportState(namespace=namespace, timezone=tz_name))
+    seen = set()
+    for idx, code, dtstart, dtend, until_dt in _plan_events(events, tz, start_date, end_date):
+        row = events[idx]
+        uid = _stable_uid(namespace, keys[idx], code)
+        seen.add(uid)
+        digest = _content_digest(row, dtstart, dtend, until_dt)
+        prior = before.get(uid)
+        if prior is not None and prior.digest == digest:
+            result.state.events.append(prior)
+            result.unchanged += 1
+            if full:
+                ev = _make_vevent(row, code, dtstart, dtend, until_dt, uid)
+                ev.add("sequence", prior.sequence)
+                cal.add_component(ev)
+            continue
+        sequence = prior.sequence + 1 if prior is not None else 0
+        ev = _make_vevent(row, code, dtstart, dtend, until_dt, uid)
+        ev.add("sequence", sequence)
+        cal.add_component(ev)
+        result.state.events.append(ExportedEvent(
+            uid=uid,
+            digest=digest,
+            sequence=sequence,
+            dtstart=dtstart.replace(tzinfo=None).isoformat(),
+            summary=row.title or "Class",
+        ))
+        if prior is None:
+            result.created += 1
+        else:
+            result.updated += 1
+
+    removed = [] if full else [e for uid, e in before.items() if uid not in seen]
+    # A removals-only update is just the CANCEL object; an update with no
+    # changes at all still returns a valid (empty) calendar.
+    out = cal.to_ical() if cal.subcomponents or not removed else b""
+    if removed:
+        prior_tz = pytz.timezone(previous.timezone)
+        # CANCEL has to be its own iCalendar object (METHOD is per object).
+        cancel = _new_calendar(tz_name, calendar_name, method="CANCEL")
+        for gone in removed:
+            ev = Event()
+            ev.add("uid", gone.uid)
+            ev.add("dtstamp", datetime.utcnow())
+            ev.add("sequence", gone.sequence + 1)
+            ev.add("status", "CANCELLED")
+            ev.add("summary", gone.summary)
+            ev.add("dtstart", prior_tz.localize(datetime.fromisoformat(gone.dtstart)))
+            cancel.add_component(ev)
+        out += cancel.to_ical()
+        result.cancelled = len(removed)
+    result.ics = out
+    return result
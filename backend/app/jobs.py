@@ -0,0 +1,198 @@
+"""
+Persistent extraction job queue (SQLite).
+
+The web process enqueues uploads and returns a job id right away; worker
+processes (app.worker) claim jobs with a lease, run the model call and store
+the ExtractResponse. A job whose worker died is re-claimed once its lease
+expires, so queued and in-progress work survives restarts. Every claim gets
+its own lease token; renewals and outcomes from a worker that no longer
+holds the lease are ignored.
+"""
+from __future__ import annotations
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .storage import connect, data_dir, init_database
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    image       BLOB,
+    params      TEXT NOT NULL,
+    result      TEXT,
+    error       TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    lease_token TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+"""
+
+
+@dataclass
+class Job:
+    id: str
+    status: str
+    params: Dict[str, Any]
+    image: Optional[bytes] = None
+    result: Optional[str] = None   # ExtractResponse JSON
+    error: Optional[str] = None
+    attempts: int = 0
+    lease_token: Optional[str] = None
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.path = Path(path) if path else data_dir() / "jobs.sqlite3"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        init_database(self.path, _SCHEMA)
+
+    def enqueue(self, image: bytes, params: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, image, params, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, image, json.dumps(params), now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT id, status, params, result, error, attempts FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row["id"],
+            status=row["status"],
+            params=json.loads(row["params"]),
+            result=row["result"],
+            error=row["error"],
+            attempts=row["attempts"],
+        )
+
+    def claim(self) -> Optional[Job]:
+        """Lease the oldest runnable job (queued, or running with an expired lease)."""
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = conn.execute(
+                        "SELECT id, params, image, attempts FROM jobs"
+                        " WHERE status = ? OR (status = ? AND lease_until < ?)"
+                        " ORDER BY created_at LIMIT 1",
+                        (QUEUED, RUNNING, now),
+                    ).fetchone()
+                    if row is None:
+                        conn.execute("COMMIT")
+                        return None
+                    if row["attempts"] >= self.max_attempts:
+                        # Its worker kept dying mid-call; stop handing it out.
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, image = NULL,"
+                            " lease_until = NULL, lease_token = NULL, updated_at = ? WHERE id = ?",
+                            (FAILED, "Job abandoned after repeated worker failures.", now, row["id"]),
+                        )
+                        continue
+                    token = uuid.uuid4().hex
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1,"
+                        " lease_until = ?, lease_token = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, now + self.lease_seconds, token, now, row["id"]),
+                    )
+                    conn.execute("COMMIT")
+                    return Job(
+                        id=row["id"],
+                        status=RUNNING,
+                        params=json.loads(row["params"]),
+                        image=row["image"],
+                        attempts=row["attempts"] + 1,
+                        lease_token=token,
+                    )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, job_id: str, lease_token: str) -> bool:
+        """Extend a lease we still hold; False once another worker has re-claimed the job."""
+        now = time.time()
+        with connect(self.path) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ?"
+                " WHERE id = ? AND status = ? AND lease_token = ?",
+                (now + self.lease_seconds, now, job_id, RUNNING, lease_token),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job_id: str, lease_token: str, result_json: str) -> bool:
+        return self._finish(job_id, lease_token, DONE, result=result_json)
+
+    def fail(self, job_id: str, lease_token: str, error: str) -> bool:
+        return self._finish(job_id, lease_token, FAILED, error=error)
+
+    def _finish(
+        self,
+        job_id: str,
+        lease_token: str,
+        status: str,
+        result: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> bool:
+        with connect(self.path) as conn:
+            # The upload is no longer needed once the job has an outcome.
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL,"
+                " lease_until = NULL, lease_token = NULL, updated_at = ?"
+                " WHERE id = ? AND status = ? AND lease_token = ?",
+                (status, result, error, time.time(), job_id, RUNNING, lease_token),
+            )
+            return cur.rowcount == 1
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated more than `older_than` seconds ago."""
+        cutoff = time.time() - older_than
+        with connect(self.path) as conn:
+            cur = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, cutoff),
+            )
+            return cur.rowcount
+
+
+_queue: Optional[JobQueue] = None
+
+def get_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS") or DEFAULT_LEASE_SECONDS),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS") or DEFAULT_MAX_ATTEMPTS),
+        )
+    return _queue
@@ -1,5 +1,5 @@
 from __future__ import annotations
-import io, os, json, re
+import asyncio, copy, hashlib, io, os, json, re
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -7,6 +7,12 @@ from PIL import Image
 import google.generativeai as genai
 from dotenv import load_dotenv, find_dotenv
 
+from .resilience import AIMDLimiter, ResilientBackend, RetryPolicy
+from .singleflight import DEFAULT_RESULT_TTL, FileLockStore, SingleFlight
+from .storage import data_dir
+from . import tiling
+from .phash import DEFAULT_SIMILARITY, DEFAULT_TTL_DAYS, NearDuplicateIndex, fingerprint
+
 DEFAULT_GEMINI_MODEL = "models/gemini-2.0-flash"  # fast + vision
 
 # ---- Prompt tuned to your parser expectations ----
@@ -117,14 +123,19 @@ def _fallback_parse_bullets(text: str) -> Optional[List[Dict[str, Any]]]:
         })
     return items if hit else None
 
-def extract_from_image(image_bytes: bytes, ocr_hint: Optional[str] = None) -> List[dict]:
+def extract_from_image(
+    image_bytes: bytes,
+    ocr_hint: Optional[str] = None,
+    model_name: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> List[dict]:
     """
     Returns a Python list of dicts (events), NOT Pydantic models.
     """
     _load_env_and_configure()
 
     model = genai.GenerativeModel(
-        _model_name(),
+        model_name or _model_name(),
         generation_config={
             # This strongly biases the model to return JSON (and only JSON)
             "temperature": 0,
@@ -136,7 +147,8 @@ def extract_from_image(image_bytes: bytes, ocr_hint: Optional[str] = None) -> Li
     if ocr_hint:
         parts.append(f"OCR transcription (may be noisy):\n{ocr_hint}")
 
-    response = model.generate_content(parts)
+    request_options = {"timeout": timeout} if timeout else None
+    response = model.generate_content(parts, request_options=request_options)
     text = (getattr(response, "text", "") or "").strip()
 
     # 1) Try clean JSON paths
@@ -155,3 +167,133 @@ def extract_from_image(image_bytes: bytes, ocr_hint: Optional[str] = None) -> Li
             return bullets
         # 3) Give a helpful error with the original text for debugging
         raise RuntimeError("Could not parse JSON from model response:\n" + text)
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    raw = os.getenv(name)
+    return float(raw) if raw else default
+
+# ---- Resilience (adaptive concurrency, retries, hedging) ----
+_backend: Optional[ResilientBackend] = None
+
+def _get_backend() -> ResilientBackend:
+    global _backend
+    if _backend is None:
+        _backend = ResilientBackend(
+            limiter=AIMDLimiter(
+                initial=_env_float("GEMINI_INITIAL_CONCURRENCY", 4),
+                maximum=_env_float("GEMINI_MAX_CONCURRENCY", 16),
+                latency_target=_env_float("GEMINI_LATENCY_TARGET", 20.0),
+            ),
+            retry=RetryPolicy(max_attempts=int(_env_float("GEMINI_MAX_ATTEMPTS", 3))),
+            attempt_timeout=_env_float("GEMINI_ATTEMPT_TIMEOUT", 45.0),
+            # e.g. models/gemini-2.0-flash-lite; unset disables hedging
+            hedge_model=os.getenv("GEMINI_HEDGE_MODEL") or None,
+            hedge_percentile=_env_float("GEMINI_HEDGE_PERCENTILE", 0.95),
+            hedge_after=_env_float("GEMINI_HEDGE_AFTER", None),
+        )
+    return _backend
+
+# ---- Tiled extraction ----
+# Tall scrolling screenshots are cut at row boundaries into overlapping
+# tiles that are extracted concurrently, so latency follows the slowest tile.
+
+def _split_for_extraction(image_bytes: bytes) -> Optional[List[bytes]]:
+    if (os.getenv("EXTRACT_TILING") or "1") == "0":
+        return None
+    return tiling.split_tiles(
+        image_bytes,
+        min_height=int(_env_float("TILE_MIN_HEIGHT", tiling.DEFAULT_MIN_HEIGHT)),
+        target_height=int(_env_float("TILE_TARGET_HEIGHT", tiling.DEFAULT_TARGET_HEIGHT)),
+        overlap=int(_env_float("TILE_OVERLAP", tiling.DEFAULT_OVERLAP)),
+    )
+
+async def _extract(image_bytes: bytes, ocr_hint: Optional[str], model_name: str) -> List[dict]:
+    backend = _get_backend()
+    whole = lambda model, timeout: extract_from_image(image_bytes, ocr_hint, model, timeout)
+    tiles = await asyncio.to_thread(_split_for_extraction, image_bytes)
+    if not tiles:
+        return await backend.call(whole, model_name)
+    # The OCR hint covers the whole page, so it is not sent with tiles.
+    calls = [
+        asyncio.ensure_future(backend.call(
+            lambda model, timeout, tile=tile: extract_from_image(tile, None, model, timeout),
+            model_name,
+        ))
+        for tile in tiles
+    ]
+    results: Optional[List[List[dict]]] = None
+    try:
+        results = await asyncio.gather(*calls)
+    except Exception:
+        pass
+    finally:
+        # gather() leaves siblings running after the first failure.
+        for call in calls:
+            call.cancel()
+    if results is None:
+        # One failed tile sinks the merge; give the model the whole page.
+        return await backend.call(whole, model_name)
+    return tiling.merge_rows(results)
+
+# ---- In-flight coalescing ----
+# A screenshot shared in a class group chat arrives dozens of times within
+# seconds; all copies await one model call instead of each paying for it.
+_inflight: Optional[SingleFlight] = None
+
+def _get_inflight() -> SingleFlight:
+    global _inflight
+    if _inflight is None:
+        ttl = float(os.getenv("SINGLEFLIGHT_RESULT_TTL") or DEFAULT_RESULT_TTL)
+        _inflight = SingleFlight(FileLockStore(data_dir("singleflight"), result_ttl=ttl))
+    return _inflight
+
+def _request_key(image_bytes: bytes, ocr_hint: Optional[str], model_name: str) -> str:
+    h = hashlib.sha256(image_bytes)
+    if ocr_hint:
+        h.update(b"\0" + ocr_hint.encode("utf-8"))
+    return f"{model_name}:{h.hexdigest()}"
+
+# ---- Near-duplicate cache ----
+# Re-captured screenshots (new crop, clock, JPEG re-encode) from the same
+# session reuse an earlier extraction: perceptual hashes within
+# PHASH_SIMILARITY find candidates, a pixel comparison confirms the text.
+_near_dupes: Optional[NearDuplicateIndex] = None
+
+def _get_near_dupes() -> Optional[NearDuplicateIndex]:
+    global _near_dupes
+    if (os.getenv("PHASH_CACHE") or "1") == "0":
+        return None
+    if _near_dupes is None:
+        _near_dupes = NearDuplicateIndex(
+            similarity=_env_float("PHASH_SIMILARITY", DEFAULT_SIMILARITY),
+            ttl_days=_env_float("PHASH_TTL_DAYS", DEFAULT_TTL_DAYS),
+        )
+    return _near_dupes
+
+async def extract_from_image_shared(
+    image_bytes: bytes,
+    ocr_hint: Optional[str] = None,
+    scope: Optional[str] = None,
+) -> List[dict]:
+    """
+    Async extract_from_image() that shares one model call between identical
+    concurrent requests (same image bytes + model), across uvicorn workers,
+    and answers near-duplicates of earlier screenshots from the same `scope`
+    (user session) without a model call. Without a scope the near-duplicate
+    cache is skipped.
+    """
+    model_name = _model_name()
+    index = _get_near_dupes() if scope else None
+    fp = await asyncio.to_thread(fingerprint, image_bytes) if index else None
+    if fp is not None:
+        prior = await asyncio.to_thread(index.lookup, fp, model_name, scope)
+        if prior is not None:
+            return prior
+
+    key = _request_key(image_bytes, ocr_hint, model_name)
+    result = await _get_inflight().do(key, lambda: _extract(image_bytes, ocr_hint, model_name))
+    if fp is not None and result:
+        await asyncio.to_thread(index.add, fp, model_name, scope, result)
+    # Each waiter gets its own copy so callers can't mutate a shared result.
+    return copy.deepcopy(result)
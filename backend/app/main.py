@@ -1,23 +1,54 @@
 from __future__ import annotations
 
-import io
+import asyncio
 import os
+import re
+import secrets
+import time
 from datetime import date
 from typing import List, Optional, Tuple
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 from dotenv import load_dotenv
+import requests
 
-from .schema import EventRow, ExtractResponse, ICSRequest
-from .llm_gemini import extract_from_image
+from .schema import (
+    EventRow,
+    ExportState,
+    ExtractResponse,
+    FeedResponse,
+    GoogleSyncRequest,
+    GoogleSyncResponse,
+    ICSRequest,
+    ICSUpdateRequest,
+    ICSUpdateResponse,
+    JobResponse,
+)
+from .llm_gemini import extract_from_image_shared
 from .parser import from_gemini_json
-from .build_calendar import infer_range
-from .ics import build_ics
+from .extraction import apply_global_dates, build_extract_response, resolve_timezone
+from .jobs import DONE, FAILED, get_queue
+from .ics import build_ics, build_ics_update
+from .feeds import (
+    Feed,
+    accepts_gzip,
+    get_store as get_feed_store,
+    hash_token,
+    new_edit_token,
+    new_feed_id,
+    not_modified,
+    token_matches,
+)
+from .google_sync import GoogleCalendarClient, SyncStateStore, sync_events, sync_scope
+from .compression import DEFAULT_MINIMUM_SIZE, CompressionMiddleware
 
 load_dotenv()  # load .env at startup
 
+# No default_response_class: routes with a response_model are serialized by
+# Pydantic's dump_json fast path (FastAPI >= 0.130), which only applies to the
+# default class.
 app = FastAPI(title="Schedulify Class Sync (Backend)")
 
 app.add_middleware(
@@ -31,25 +62,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-
-def _resolve_timezone(tz_name: Optional[str]) -> str:
-    return tz_name or os.environ.get("DEFAULT_TIMEZONE") or "UTC"
-
-
-def _apply_global_dates(
-    events: List[EventRow],
-    start: Optional[date],
-    end: Optional[date],
-) -> List[EventRow]:
-    updated: List[EventRow] = []
-    for ev in events:
-        updates = {}
-        if start and ev.start_date is None:
-            updates["start_date"] = start
-        if end and ev.end_date is None:
-            updates["end_date"] = end
-        updated.append(ev if not updates else ev.model_copy(update=updates))
-    return updated
+# gzip/brotli for JSON and text/calendar bodies above the threshold
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESS_MIN_BYTES") or DEFAULT_MINIMUM_SIZE),
+)
 
 
 def _resolve_date_range(
@@ -76,9 +93,47 @@ def _resolve_date_range(
     return resolved_start, resolved_end
 
 
-def _stream_ics(data: bytes, filename: str = "schedule.ics") -> StreamingResponse:
+def _render_ics(payload: ICSRequest, calendar_name: str = "Class Schedule") -> bytes:
+    events = apply_global_dates(payload.events, payload.start_date, payload.end_date)
+    tz = resolve_timezone(payload.timezone)
+    start, end = _resolve_date_range(events, payload.start_date, payload.end_date)
+    try:
+        return build_ics(events, tz, start, end, calendar_name=calendar_name)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+# The near-duplicate cache only reuses extractions within one browser
+# session, identified by an opaque random cookie.
+SESSION_COOKIE = "schedulify_session"
+SESSION_MAX_AGE = 30 * 86400
+_SESSION_RE = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+
+def _session_scope(request: Request) -> str:
+    session = request.cookies.get(SESSION_COOKIE)
+    if session and _SESSION_RE.fullmatch(session):
+        return session
+    return secrets.token_urlsafe(16)
+
+
+def _keep_session(request: Request, response: Response, session: str) -> None:
+    if request.cookies.get(SESSION_COOKIE) != session:
+        response.set_cookie(
+            SESSION_COOKIE, session, max_age=SESSION_MAX_AGE, httponly=True, samesite="lax"
+        )
+
+
+def _require_image(file: UploadFile) -> None:
+    if not file.content_type or not file.content_type.startswith(("image/", "application/pdf")):
+        raise HTTPException(status_code=400, detail="Please upload an image file (png/jpg/pdf).")
+
+
+def _ics_response(data: bytes, filename: str = "schedule.ics") -> Response:
+    # A plain Response: the bytes are already in memory, and streaming a
+    # BytesIO would send one ASGI message per ICS line.
     headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(io.BytesIO(data), headers=headers, media_type="text/calendar")
+    return Response(content=data, headers=headers, media_type="text/calendar")
 
 
 @app.get("/health")
@@ -87,53 +142,25 @@ def health():
 
 @app.post("/extract-gemini", response_model=ExtractResponse)
 async def extract_gemini(
+    request: Request,
+    response: Response,
     file: UploadFile = File(..., description="Screenshot image"),
     start_date: Optional[date] = Form(None),
     end_date: Optional[date] = Form(None),
     timezone: Optional[str] = Form(None),
     include_heuristic_hint: Optional[bool] = Form(None),
 ):
-    if not file.content_type or not file.content_type.startswith(("image/", "application/pdf")):
-        raise HTTPException(status_code=400, detail="Please upload an image file (png/jpg/pdf).")
+    _require_image(file)
 
     image_bytes = await file.read()
-    raw = extract_from_image(image_bytes)
-    events = from_gemini_json(raw)
-    tz = _resolve_timezone(timezone)
-
-    events = _apply_global_dates(events, start_date, end_date)
-
-    has_start = bool(start_date) or any(ev.start_date for ev in events)
-    has_end = bool(end_date) or any(ev.end_date for ev in events)
-    needs_dates = not (has_start and has_end)
-
-    inferred_start = None
-    inferred_end = None
-    if start_date or end_date:
-        inferred_start, inferred_end, _ = infer_range(start_date, end_date, tz)
-    else:
-        event_starts = [ev.start_date for ev in events if ev.start_date]
-        event_ends = [ev.end_date for ev in events if ev.end_date]
-        if event_starts:
-            inferred_start = min(event_starts)
-        if event_ends:
-            inferred_end = max(event_ends)
-
-    note = None
-    if needs_dates:
-        note = "Add the term's start and end dates before exporting to calendar."
-
-    return ExtractResponse(
-        events=events,
-        timezone=tz,
-        inferred_start=inferred_start,
-        inferred_end=inferred_end,
-        needs_dates=needs_dates,
-        note=note,
-    )
+    session = _session_scope(request)
+    raw = await extract_from_image_shared(image_bytes, scope=session)
+    _keep_session(request, response, session)
+    return build_extract_response(raw, start_date, end_date, timezone)
 
 @app.post("/extract-to-ics")
 async def extract_to_ics(
+    request: Request,
     file: UploadFile = File(...),
     start_date: Optional[date] = Form(None),
     end_date: Optional[date] = Form(None),
@@ -141,26 +168,223 @@ async def extract_to_ics(
 ):
     # 1) extract
     image_bytes = await file.read()
-    raw = extract_from_image(image_bytes)
+    session = _session_scope(request)
+    raw = await extract_from_image_shared(image_bytes, scope=session)
     events = from_gemini_json(raw)
-    events = _apply_global_dates(events, start_date, end_date)
-    tz = _resolve_timezone(timezone)
+    events = apply_global_dates(events, start_date, end_date)
+    tz = resolve_timezone(timezone)
     start, end = _resolve_date_range(events, start_date, end_date)
     # 3) build ICS
     try:
         ics_bytes = build_ics(events, tz, start, end)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    return _stream_ics(ics_bytes)
+    response = _ics_response(ics_bytes)
+    _keep_session(request, response, session)
+    return response
 
 @app.post("/ics")
 @app.post("/make-ics")
 async def make_ics(payload: ICSRequest):
-    events = _apply_global_dates(payload.events, payload.start_date, payload.end_date)
-    tz = _resolve_timezone(payload.timezone)
+    return _ics_response(_render_ics(payload))
+
+@app.post("/make-ics-update", response_model=ICSUpdateResponse)
+async def make_ics_update(payload: ICSUpdateRequest):
+    """
+    Like /make-ics, but returns only what changed since `previous` (the
+    state from the last call) with stable UIDs, bumped SEQUENCE and
+    cancellations. Omit `previous` on the first export.
+    """
+    events = apply_global_dates(payload.events, payload.start_date, payload.end_date)
+    tz = resolve_timezone(payload.timezone)
     start, end = _resolve_date_range(events, payload.start_date, payload.end_date)
     try:
-        ics_bytes = build_ics(events, tz, start, end)
+        update = build_ics_update(events, tz, start, end, previous=payload.previous)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    return _stream_ics(ics_bytes)
+    return ICSUpdateResponse(
+        ics=update.ics.decode("utf-8"),
+        state=update.state,
+        created=update.created,
+        updated=update.updated,
+        cancelled=update.cancelled,
+        unchanged=update.unchanged,
+    )
+
+
+# ---- Asynchronous extraction jobs ----
+# POST returns immediately; app.worker processes run the model call.
+
+JOB_POLL_INTERVAL = 0.5
+JOB_MAX_WAIT = 30.0  # stay under nginx's default 60s proxy_read_timeout
+
+
+def _job_response(job) -> JobResponse:
+    result = ExtractResponse.model_validate_json(job.result) if job.result else None
+    return JobResponse(job_id=job.id, status=job.status, result=result, error=job.error)
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(..., description="Screenshot image"),
+    start_date: Optional[date] = Form(None),
+    end_date: Optional[date] = Form(None),
+    timezone: Optional[str] = Form(None),
+):
+    _require_image(file)
+    image_bytes = await file.read()
+    session = _session_scope(request)
+    params = {
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "timezone": timezone,
+        "scope": session,
+    }
+    job_id = await asyncio.to_thread(get_queue().enqueue, image_bytes, params)
+    _keep_session(request, response, session)
+    return JobResponse(job_id=job_id, status="queued")
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=JOB_MAX_WAIT, description="Long-poll up to this many seconds"),
+):
+    queue = get_queue()
+    deadline = time.monotonic() + wait
+    while True:
+        job = await asyncio.to_thread(queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job id.")
+        if job.status in (DONE, FAILED) or time.monotonic() >= deadline:
+            return _job_response(job)
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+# ---- Google Calendar sync ----
+
+@app.post("/google/sync", response_model=GoogleSyncResponse)
+async def google_sync(payload: GoogleSyncRequest):
+    tz = resolve_timezone(payload.timezone)
+    start, end = _resolve_date_range(payload.events, payload.start_date, payload.end_date)
+    events = apply_global_dates(payload.events, start, end)
+    store = SyncStateStore()
+    client = GoogleCalendarClient(payload.access_token, payload.calendar_id)
+
+    def run():
+        scope = sync_scope(client)
+        result = sync_events(client, events, tz, store.load(scope), scope)
+        store.save(scope, result.state)
+        return result
+
+    try:
+        result = await asyncio.to_thread(run)
+    except requests.HTTPError as exc:
+        status = exc.response.status_code if exc.response is not None else 502
+        raise HTTPException(status_code=502 if status >= 500 else status, detail=str(exc)) from exc
+    return GoogleSyncResponse(
+        created=result.created,
+        updated=result.updated,
+        deleted=result.deleted,
+        unchanged=result.unchanged,
+        errors=result.errors,
+    )
+
+
+# ---- Subscribable calendar feeds ----
+# Rendered once on save; polls are served from pre-rendered bytes.
+
+# no-transform: the feed route picks between its own pre-rendered identity
+# and gzip bodies (each with its own ETag); CompressionMiddleware must not
+# re-encode the identity body under the identity ETag.
+FEED_CACHE_CONTROL = "private, max-age=300, no-transform"
+
+
+async def _save_feed(
+    feed_id: str,
+    payload: ICSRequest,
+    token_hash: str,
+    previous: Optional[ExportState] = None,
+) -> FeedResponse:
+    # Render with the stable per-feed UIDs: an edit updates events in the
+    # subscribed calendar (bumped SEQUENCE) instead of replacing them all.
+    events = apply_global_dates(payload.events, payload.start_date, payload.end_date)
+    tz = resolve_timezone(payload.timezone)
+    start, end = _resolve_date_range(events, payload.start_date, payload.end_date)
+    try:
+        rendered = build_ics_update(events, tz, start, end, previous=previous, full=True)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    await asyncio.to_thread(
+        get_feed_store().save,
+        feed_id,
+        payload.model_dump_json(),
+        rendered.ics,
+        rendered.state.model_dump_json(),
+        token_hash,
+    )
+    return FeedResponse(id=feed_id, path=f"/feeds/{feed_id}.ics")
+
+
+def _edit_token(authorization: Optional[str]) -> Optional[str]:
+    scheme, _, token = (authorization or "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else None
+
+
+async def _editable_feed(feed_id: str, authorization: Optional[str]) -> Feed:
+    feed = await asyncio.to_thread(get_feed_store().get, feed_id, True)
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Unknown feed.")
+    if not token_matches(feed, _edit_token(authorization)):
+        raise HTTPException(status_code=403, detail="Missing or invalid feed edit token.")
+    return feed
+
+
+@app.post("/feeds", response_model=FeedResponse, status_code=201)
+async def create_feed(payload: ICSRequest):
+    token = new_edit_token()
+    response = await _save_feed(new_feed_id(), payload, hash_token(token))
+    response.edit_token = token
+    return response
+
+
+@app.put("/feeds/{feed_id}", response_model=FeedResponse)
+async def update_feed(feed_id: str, payload: ICSRequest, authorization: Optional[str] = Header(None)):
+    feed = await _editable_feed(feed_id, authorization)
+    previous = ExportState.model_validate_json(feed.state) if feed.state else None
+    return await _save_feed(feed_id, payload, feed.token_hash, previous)
+
+
+@app.delete("/feeds/{feed_id}", status_code=204)
+async def delete_feed(feed_id: str, authorization: Optional[str] = Header(None)):
+    await _editable_feed(feed_id, authorization)
+    if not await asyncio.to_thread(get_feed_store().delete, feed_id):
+        raise HTTPException(status_code=404, detail="Unknown feed.")
+    return Response(status_code=204)
+
+
+@app.get("/feeds/{feed_id}.ics")
+def get_feed(feed_id: str, request: Request):
+    # Sync route: runs in the threadpool, so the cached SQLite read is fine.
+    feed = get_feed_store().get(feed_id)
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Unknown feed.")
+
+    use_gzip = accepts_gzip(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": feed.gzip_etag if use_gzip else feed.etag,
+        "Last-Modified": feed.last_modified,
+        "Cache-Control": FEED_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if not_modified(feed, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+
+    body = feed.ics
+    if use_gzip:
+        body = feed.ics_gz
+        headers["Content-Encoding"] = "gzip"
+    headers["Content-Disposition"] = f'inline; filename="{feed_id}.ics"'
+    return Response(content=body, headers=headers, media_type="text/calendar")
@@ -0,0 +1,307 @@
+"""
+Perceptual-hash cache for re-captured screenshots.
+
+Students re-screenshot the same portal page with a slightly different crop,
+a new status-bar clock or another JPEG encode, which defeats exact-byte
+hashing. Each image gets a 128-bit fingerprint (64-bit dHash + 64-bit
+pHash, both computed with NumPy on a downscaled grayscale copy), and a
+BK-tree over Hamming distance finds earlier extractions of near-identical
+images.
+
+The hashes only see the page layout: two students' schedules from the same
+portal are a few bits apart. A hash match is therefore just a candidate;
+it is reused only if a block-by-block pixel comparison at text resolution
+(after aligning for the crop) finds no changed text. Entries are scoped to
+one user session, so a result is never handed to someone else. Fingerprints
+and results persist in SQLite so every worker shares them.
+"""
+from __future__ import annotations
+import io
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .storage import connect, data_dir, init_database
+
+HASH_BITS = 128
+DEFAULT_SIMILARITY = 0.93   # 1 - distance / HASH_BITS; 0.93 allows 8 differing bits
+DEFAULT_TTL_DAYS = 30.0
+MAX_ASPECT_DRIFT = 0.15     # relative aspect-ratio change still treated as the same page
+MAX_CANDIDATES = 3          # hash matches confirmed pixel by pixel per lookup
+PRUNE_INTERVAL = 3600.0     # seconds between expiry sweeps from add()
+
+# Content confirmation
+CONFIRM_WIDTH = 1600        # px; stored grayscale copy (phone screenshots fit unscaled)
+CONFIRM_BLOCK = 16          # px per compared block
+CONFIRM_SHIFT = 8           # px of crop offset searched for
+CONFIRM_LEVEL = 80          # grey-level difference that marks a pixel as changed
+CONFIRM_MAX_CHANGED = 4     # changed pixels a block tolerates (JPEG ringing)
+STATUS_BAR = 0.05           # top fraction ignored: a phone's clock changes between captures
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope      TEXT NOT NULL,
+    model      TEXT NOT NULL,
+    hash       TEXT NOT NULL,
+    aspect     REAL NOT NULL,
+    pixels     BLOB NOT NULL,
+    result     TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class Fingerprint(NamedTuple):
+    hash: int             # dHash << 64 | pHash
+    aspect: float         # height / width
+    pixels: np.ndarray    # grayscale copy at most CONFIRM_WIDTH px wide
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int("".join("1" if b else "0" for b in bits.flatten()), 2)
+
+
+def dhash(gray: Image.Image, size: int = 8) -> int:
+    """Horizontal gradient hash: is each pixel brighter than its right neighbour?"""
+    small = np.asarray(gray.resize((size + 1, size), Image.Resampling.LANCZOS), dtype=np.float32)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(gray: Image.Image) -> int:
+    """DCT hash: low-frequency coefficients above/below their median."""
+    small = np.asarray(gray.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float32)
+    coeffs = _DCT32 @ small @ _DCT32.T
+    low = coeffs[:8, :8].flatten()[1:]  # drop the DC term
+    bits = np.append(low > np.median(low), False)
+    return _bits_to_int(bits)
+
+
+def content_pixels(gray: Image.Image) -> np.ndarray:
+    if gray.width > CONFIRM_WIDTH:
+        height = max(1, round(gray.height * CONFIRM_WIDTH / gray.width))
+        gray = gray.resize((CONFIRM_WIDTH, height), Image.Resampling.LANCZOS)
+    return np.asarray(gray, dtype=np.uint8)
+
+
+def fingerprint(image_bytes: bytes) -> Optional[Fingerprint]:
+    """Hash, aspect ratio and comparison pixels, or None if the bytes aren't a raster image."""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        gray = image.convert("L")
+    except Exception:
+        return None
+    width, height = gray.size
+    return Fingerprint((dhash(gray) << 64) | phash(gray), height / max(width, 1), content_pixels(gray))
+
+
+def _shift_error(ref: np.ndarray, moved: np.ndarray, dy: int, dx: int, margin: int, step: int = 1) -> float:
+    h, w = ref.shape[0] - 2 * margin, ref.shape[1] - 2 * margin
+    a = ref[margin:margin + h:step, margin:margin + w]
+    b = moved[margin + dy:margin + dy + h:step, margin + dx:margin + dx + w]
+    return float(np.abs(a - b).mean())
+
+
+def _align(ref: np.ndarray, moved: np.ndarray, radius: int) -> Tuple[int, int]:
+    """(dy, dx) that best lays `moved` over `ref`: coarse at 1/4 scale, then to the pixel."""
+    def quarter(a: np.ndarray) -> np.ndarray:
+        h, w = a.shape[0] // 4 * 4, a.shape[1] // 4 * 4
+        return a[:h, :w].reshape(h // 4, 4, w // 4, 4).mean(axis=(1, 3))
+
+    small_ref, small_moved = quarter(ref), quarter(moved)
+    r = max(1, radius // 4)
+    if min(small_ref.shape) <= 2 * r:
+        return 0, 0
+    coarse = min(
+        ((dy, dx) for dy in range(-r, r + 1) for dx in range(-r, r + 1)),
+        key=lambda d: _shift_error(small_ref, small_moved, d[0], d[1], r),
+    )
+    # Every 4th row is plenty to pin the offset down to the pixel.
+    return min(
+        ((coarse[0] * 4 + dy, coarse[1] * 4 + dx) for dy in range(-3, 4) for dx in range(-3, 4)),
+        key=lambda d: _shift_error(ref, moved, d[0], d[1], radius + 3, step=4),
+    )
+
+
+def same_content(stored: np.ndarray, candidate: np.ndarray) -> bool:
+    """
+    True if `candidate` shows the same text as `stored`: after aligning for
+    the crop, no block may have more than CONFIRM_MAX_CHANGED strongly
+    different pixels.
+    """
+    h, w = stored.shape
+    if abs(candidate.shape[1] - w) > CONFIRM_SHIFT:
+        # A different capture scale: bring it to ours first.
+        height = max(1, round(candidate.shape[0] * w / candidate.shape[1]))
+        candidate = np.asarray(Image.fromarray(candidate).resize((w, height), Image.Resampling.LANCZOS))
+    if abs(candidate.shape[0] - h) > CONFIRM_SHIFT:
+        return False  # rows were added or cut off, not just a re-crop
+
+    # Pixels outside the candidate are NaN: unknown, so never "changed".
+    pad = CONFIRM_SHIFT + 4
+    canvas = np.full((h + 2 * pad, w + 2 * pad), np.nan, dtype=np.float32)
+    ch, cw = min(h, candidate.shape[0]), min(w, candidate.shape[1])
+    canvas[pad:pad + ch, pad:pad + cw] = candidate[:ch, :cw]
+    ref = stored.astype(np.float32)
+    gdy, gdx = _align(
+        np.pad(ref, pad, mode="edge"), np.nan_to_num(canvas, nan=255.0), CONFIRM_SHIFT
+    )
+
+    top = int(np.ceil(h * STATUS_BAR / CONFIRM_BLOCK)) * CONFIRM_BLOCK
+    bh, bw = (h - top) // CONFIRM_BLOCK, w // CONFIRM_BLOCK
+    if bh <= 0 or bw <= 0:
+        return False
+    ref = ref[top:top + bh * CONFIRM_BLOCK, :bw * CONFIRM_BLOCK]
+    changed = np.full((bh, bw), np.inf, dtype=np.float32)
+    # A pixel of slack per block absorbs JPEG blur and rescaling drift.
+    for dy in range(gdy - 1, gdy + 2):
+        for dx in range(gdx - 1, gdx + 2):
+            window = canvas[pad + top + dy:pad + top + dy + ref.shape[0], pad + dx:pad + dx + ref.shape[1]]
+            with np.errstate(invalid="ignore"):
+                diff = np.abs(window - ref) > CONFIRM_LEVEL
+            np.minimum(changed, diff.reshape(bh, CONFIRM_BLOCK, bw, CONFIRM_BLOCK).sum(axis=(1, 3)), out=changed)
+    return bool(changed.max() <= CONFIRM_MAX_CHANGED)
+
+
+def _encode_pixels(pixels: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _decode_pixels(blob: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(blob)).convert("L"), dtype=np.uint8)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance."""
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [key, values, {distance: child}]
+        self.size = 0
+
+    def add(self, key: int, value: Any) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(key, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: int, max_distance: int) -> List[Tuple[int, Any]]:
+        found: List[Tuple[int, Any]] = []
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(key, node[0])
+            if d <= max_distance:
+                found.extend((d, v) for v in node[1])
+            # Triangle inequality: only subtrees within d ± max_distance can match.
+            for dist, child in node[2].items():
+                if d - max_distance <= dist <= d + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class NearDuplicateIndex:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        similarity: float = DEFAULT_SIMILARITY,
+        ttl_days: float = DEFAULT_TTL_DAYS,
+    ):
+        self.path = Path(path) if path else data_dir() / "phash.sqlite3"
+        self.max_distance = int((1.0 - similarity) * HASH_BITS)
+        self.ttl_seconds = ttl_days * 86400
+        self._trees: Dict[Tuple[str, str], BKTree] = {}
+        self._last_id = 0
+        self._lock = threading.Lock()  # lookups run in asyncio.to_thread workers
+        init_database(self.path, _SCHEMA)
+        self._prune()
+
+    def _prune(self) -> None:
+        """Delete expired rows and drop the trees so they reload without them."""
+        with connect(self.path) as conn:
+            conn.execute(
+                "DELETE FROM fingerprints WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+        with self._lock:
+            self._trees = {}
+            self._last_id = 0
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+
+    def _refresh(self) -> None:
+        # Pick up rows other workers added since our last look.
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT id, scope, model, hash, aspect, created_at FROM fingerprints"
+                " WHERE id > ? ORDER BY id",
+                (self._last_id,),
+            ).fetchall()
+        for row_id, scope, model, hex_hash, aspect, created_at in rows:
+            tree = self._trees.setdefault((scope, model), BKTree())
+            tree.add(int(hex_hash, 16), (row_id, aspect, created_at))
+            self._last_id = row_id
+
+    def lookup(self, fp: Fingerprint, model: str, scope: str) -> Optional[Any]:
+        with self._lock:
+            self._refresh()
+            tree = self._trees.get((scope, model))
+            matches = tree.search(fp.hash, self.max_distance) if tree else []
+        cutoff = time.time() - self.ttl_seconds
+        candidates = [
+            row_id
+            for _, (row_id, prior_aspect, created_at) in matches
+            if created_at >= cutoff
+            and abs(prior_aspect - fp.aspect) / max(prior_aspect, fp.aspect) <= MAX_ASPECT_DRIFT
+        ]
+        for row_id in candidates[:MAX_CANDIDATES]:
+            with connect(self.path) as conn:
+                row = conn.execute(
+                    "SELECT pixels, result FROM fingerprints WHERE id = ?", (row_id,)
+                ).fetchone()
+            if row is not None and same_content(_decode_pixels(row[0]), fp.pixels):
+                return json.loads(row[1])
+        return None
+
+    def add(self, fp: Fingerprint, model: str, scope: str, result: Any) -> None:
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO fingerprints (scope, model, hash, aspect, pixels, result, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scope, model, f"{fp.hash:032x}", fp.aspect,
+                    _encode_pixels(fp.pixels), json.dumps(result), time.time(),
+                ),
+            )
+        if time.monotonic() >= self._next_prune:
+            self._prune()
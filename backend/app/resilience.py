@@ -0,0 +1,300 @@
+"""
+Resilience layer for calls to the model backend.
+
+- AIMDLimiter: adaptive concurrency limit. Grows additively while calls are
+  fast, shrinks multiplicatively on 429s or latency above target.
+- RetryPolicy + RetryBudget: exponential backoff with full jitter, capped by
+  a token bucket so an outage can't turn into a retry storm.
+- ResilientBackend: ties them together with per-attempt deadlines and
+  optional hedging to a secondary model once the primary is slower than its
+  observed p95.
+
+All state is per process; each uvicorn worker adapts on its own.
+"""
+from __future__ import annotations
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Optional, Set
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    # google.api_core errors expose the HTTP status as .code (an int);
+    # requests/httpx errors hang it off .response.status_code.
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code
+    response = getattr(exc, "response", None)
+    code = getattr(response, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return _status_code(exc) == 429
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS
+
+
+class AIMDLimiter:
+    def __init__(
+        self,
+        initial: float = 4,
+        minimum: float = 1,
+        maximum: float = 16,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_target: Optional[float] = None,
+    ):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.inflight = 0
+        self._last_decrease = float("-inf")
+        self._cond: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def _has_room(self) -> bool:
+        return self.inflight < max(1, int(self.limit))
+
+    async def acquire(self) -> float:
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(self._has_room)
+            self.inflight += 1
+        return time.monotonic()
+
+    def try_acquire(self) -> Optional[float]:
+        """Take a slot only if one is free right now (used for hedges)."""
+        if not self._has_room():
+            return None
+        self.inflight += 1
+        return time.monotonic()
+
+    async def release(self, started: float, *, rate_limited: bool = False, succeeded: bool = True) -> None:
+        latency = time.monotonic() - started
+        slow = self.latency_target is not None and latency > self.latency_target
+        if rate_limited or slow:
+            # One decrease per congestion event: calls that were already in
+            # flight when we last backed off don't shrink the limit again.
+            if started > self._last_decrease:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._last_decrease = time.monotonic()
+        elif succeeded:
+            # +increase per full window of successful calls
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+        cond = self._condition()
+        async with cond:
+            self.inflight -= 1
+            cond.notify_all()
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+
+class RetryBudget:
+    """
+    Token bucket for retries: every first attempt deposits `ratio` tokens
+    and every retry spends one, so retries stay a bounded share of traffic.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+# fn(model_name, timeout_seconds) -> result; runs in a worker thread.
+ModelCall = Callable[[str, Optional[float]], Any]
+
+HEDGE_HEADROOM = 2  # extra model threads when hedging, so a hedge never queues
+
+
+class _Call:
+    __slots__ = ("task", "running")
+
+    def __init__(self, task: "asyncio.Task[Any]", running: "asyncio.Future[float]"):
+        self.task = task        # settles when the thread returns
+        self.running = running  # settles when the thread starts
+
+
+def _settle(future: "asyncio.Future[float]", value: float) -> None:
+    if not future.done():
+        future.set_result(value)
+
+
+class ResilientBackend:
+    def __init__(
+        self,
+        limiter: Optional[AIMDLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        budget: Optional[RetryBudget] = None,
+        attempt_timeout: Optional[float] = None,
+        hedge_model: Optional[str] = None,
+        hedge_percentile: float = 0.95,
+        hedge_after: Optional[float] = None,
+    ):
+        self.limiter = limiter or AIMDLimiter()
+        self.retry = retry or RetryPolicy()
+        self.budget = budget or RetryBudget()
+        self.attempt_timeout = attempt_timeout
+        self.hedge_model = hedge_model
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.latencies = LatencyWindow()
+        self._calls: Set["asyncio.Task[Any]"] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def call(self, fn: ModelCall, model: str) -> Any:
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                return await self._attempt(fn, model)
+            except Exception as exc:
+                if (
+                    attempt >= self.retry.max_attempts
+                    or not is_retryable(exc)
+                    or not self.budget.withdraw()
+                ):
+                    raise
+            await asyncio.sleep(self.retry.backoff(attempt))
+            attempt += 1
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_model:
+            return None
+        observed = self.latencies.percentile(self.hedge_percentile)
+        return observed if observed is not None else self.hedge_after
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Model calls get their own threads: the loop's default executor is
+        # min(32, cpus + 4) threads, fewer than the limiter allows on a small
+        # VM, and it also serves every short SQLite to_thread() call.
+        if self._executor is None:
+            workers = math.ceil(self.limiter.maximum) + (HEDGE_HEADROOM if self.hedge_model else 0)
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-call")
+        return self._executor
+
+    def _start(self, fn: ModelCall, model: str, slot: float) -> _Call:
+        loop = asyncio.get_running_loop()
+        running: "asyncio.Future[float]" = loop.create_future()
+        task = asyncio.ensure_future(self._call_in_thread(fn, model, slot, running))
+        self._calls.add(task)
+        task.add_done_callback(self._forget)
+        return _Call(task, running)
+
+    def _forget(self, task: "asyncio.Task[Any]") -> None:
+        self._calls.discard(task)
+        if not task.cancelled():
+            task.exception()  # abandoned calls' errors were never awaited
+
+    async def _call_in_thread(
+        self, fn: ModelCall, model: str, slot: float, running: "asyncio.Future[float]"
+    ) -> Any:
+        # The limiter slot follows the thread, not the awaiting caller: a
+        # timed-out attempt or a hedge loser keeps loading the backend until
+        # its thread returns, so it keeps counting against the limit too.
+        loop = asyncio.get_running_loop()
+
+        def work() -> Any:
+            loop.call_soon_threadsafe(_settle, running, time.monotonic())
+            return fn(model, self.attempt_timeout)
+
+        try:
+            result = await loop.run_in_executor(self._get_executor(), work)
+        except BaseException as exc:
+            _settle(running, slot)
+            await self.limiter.release(running.result(), rate_limited=is_rate_limited(exc), succeeded=False)
+            raise
+        # Latency for AIMD is measured from when the thread started.
+        await self.limiter.release(running.result())
+        return result
+
+    async def _run(self, fn: ModelCall, model: str, call: Optional[_Call] = None) -> Any:
+        if call is None:
+            call = self._start(fn, model, await self.limiter.acquire())
+        # The attempt deadline starts with the model call, not while it waits
+        # for a thread.
+        await asyncio.wait({call.running, call.task}, return_when=asyncio.FIRST_COMPLETED)
+        return await asyncio.wait_for(asyncio.shield(call.task), self.attempt_timeout)
+
+    async def _attempt(self, fn: ModelCall, model: str) -> Any:
+        t0 = time.monotonic()
+        primary = asyncio.ensure_future(self._run(fn, model))
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            delay = self._hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    # Only hedge into spare capacity; never queue behind the limiter.
+                    slot = self.limiter.try_acquire()
+                    if slot is not None:
+                        hedge = self._start(fn, self.hedge_model, slot)
+                        pending.add(asyncio.ensure_future(self._run(fn, self.hedge_model, hedge)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary:
+                            self.latencies.add(time.monotonic() - t0)
+                        return task.result()
+                    # Prefer surfacing the primary's error if both fail.
+                    if error is None or task is primary:
+                        error = task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
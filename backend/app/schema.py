@@ -118,6 +118,22 @@ class EventRow(BaseModel):
         return normalize_time_string(value)
 
 
+def row_keys(events: List[EventRow]) -> List[str]:
+    """
+    Stable identity for each row across edits: title + term, plus an
+    ordinal to tell apart rows sharing a title (e.g. lecture and lab).
+    Editing times, days or rooms keeps the key; renaming a course changes it.
+    """
+    counts: dict = {}
+    keys: List[str] = []
+    for ev in events:
+        base = f"{' '.join((ev.title or '').lower().split())}|{(ev.termLabel or '').lower()}"
+        n = counts.get(base, 0)
+        counts[base] = n + 1
+        keys.append(f"{base}#{n}")
+    return keys
+
+
 class ExtractRequest(BaseModel):
     timezone: Optional[str] = None
     start_date: Optional[date] = None
@@ -137,3 +153,52 @@ class ICSRequest(BaseModel):
     timezone: Optional[str] = None
     start_date: Optional[date] = None
     end_date: Optional[date] = None
+
+class ExportedEvent(BaseModel):
+    uid: str
+    digest: str
+    sequence: int = 0
+    dtstart: str = Field(..., description="ISO 8601 local time in ExportState.timezone, no offset")
+    summary: str
+
+class ExportState(BaseModel):
+    """Returned by /make-ics-update; send it back with the next update."""
+    namespace: str
+    timezone: str
+    events: List[ExportedEvent] = []
+
+class ICSUpdateRequest(ICSRequest):
+    previous: Optional[ExportState] = None
+
+class ICSUpdateResponse(BaseModel):
+    ics: str
+    state: ExportState
+    created: int
+    updated: int
+    cancelled: int
+    unchanged: int
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str = Field(..., examples=["queued", "running", "done", "failed"])
+    result: Optional[ExtractResponse] = None
+    error: Optional[str] = None
+
+class GoogleSyncRequest(ICSRequest):
+    access_token: str
+    calendar_id: str = "primary"
+
+class GoogleSyncResponse(BaseModel):
+    created: int
+    updated: int
+    deleted: int
+    unchanged: int
+    errors: List[str] = []
+
+class FeedResponse(BaseModel):
+    id: str
+    path: str = Field(..., examples=["/feeds/Zx3k...ics"], description="Subscribe with webcal:// + host + path")
+    edit_token: Optional[str] = Field(
+        None,
+        description="Only returned by POST /feeds; send as 'Authorization: Bearer <token>' to PUT/DELETE",
+    )
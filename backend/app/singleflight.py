@@ -0,0 +1,166 @@
+"""
+Single-flight request coalescing.
+
+Identical requests that arrive while one is already in flight await the
+same call instead of starting their own. Within a process this is a dict of
+shared asyncio tasks; across uvicorn workers a FileLockStore serializes
+leaders per key and hands the finished result to whoever was waiting.
+"""
+from __future__ import annotations
+import asyncio
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+DEFAULT_RESULT_TTL = 30.0   # seconds a finished result is handed to late joiners
+_POLL_INTERVAL = 0.05
+
+_MISS = object()
+
+
+class FileLockStore:
+    """
+    Cross-process coordination through flock()'d files in a local directory.
+    Each key gets its own lock file, so unrelated requests never queue
+    behind each other; the holder unlinks it on release, so the directory
+    only holds locks for calls in flight plus short-lived JSON results.
+    """
+
+    def __init__(self, directory: Path, result_ttl: float = DEFAULT_RESULT_TTL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.result_ttl = result_ttl
+
+    def _digest(self, key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _lock_path(self, key: str) -> Path:
+        return self.directory / f"{self._digest(key)}.lock"
+
+    def _result_path(self, key: str) -> Path:
+        return self.directory / f"{self._digest(key)}.json"
+
+    @asynccontextmanager
+    async def lock(self, key: str) -> AsyncIterator[None]:
+        # Poll with LOCK_NB rather than blocking in a thread: a cancelled
+        # waiter must never end up owning a lock nobody will release.
+        path = self._lock_path(key)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except OSError as exc:
+                        if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                            raise
+                        await asyncio.sleep(_POLL_INTERVAL)
+                # The previous holder unlinks the file before unlocking, so a
+                # lock on an inode that is no longer at `path` guards nothing.
+                try:
+                    current = os.stat(path).st_ino == os.fstat(fd).st_ino
+                except FileNotFoundError:
+                    current = False
+                if not current:
+                    continue
+                try:
+                    yield
+                finally:
+                    path.unlink(missing_ok=True)
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                return
+            finally:
+                os.close(fd)
+
+    def read(self, key: str) -> Any:
+        path = self._result_path(key)
+        try:
+            age = time.time() - path.stat().st_mtime
+            if age > self.result_ttl:
+                path.unlink(missing_ok=True)
+                return _MISS
+            return json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return _MISS
+
+    def write(self, key: str, value: Any) -> None:
+        path = self._result_path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(value))
+        os.replace(tmp, path)
+        self._prune()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        for stale in self.directory.glob("*.json"):
+            try:
+                if stale.stat().st_mtime < cutoff:
+                    stale.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls by key.
+
+    - Every caller awaits one shared task; the first caller's cancellation
+      does not cancel the call for the others.
+    - The shared task is cancelled only once every waiter has gone away.
+    - Exceptions propagate to every waiter and are not remembered, so the
+      next request after a failure tries again.
+    """
+
+    def __init__(self, store: Optional[FileLockStore] = None):
+        self._store = store
+        self._calls: Dict[str, _Call] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(self._run(key, fn)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, c=call: self._forget(key, c))
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is listening any more; drop the entry right away so
+                # a new caller starts fresh instead of joining a dying task.
+                self._forget(key, call)
+                call.task.cancel()
+
+    def inflight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self._store is None:
+            return await fn()
+        async with self._store.lock(key):
+            cached = self._store.read(key)
+            if cached is not _MISS:
+                return cached
+            result = await fn()
+            self._store.write(key, result)
+            return result
@@ -0,0 +1,38 @@
+from __future__ import annotations
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / ".data"
+
+def data_dir(*parts: str) -> Path:
+    """
+    Local on-disk state shared by every worker process on this machine
+    (lock files, queues, caches). Override with SCHEDULIFY_DATA_DIR.
+    """
+    root = Path(os.getenv("SCHEDULIFY_DATA_DIR") or DEFAULT_DATA_DIR)
+    path = root.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+@contextmanager
+def connect(path: Path) -> Iterator[sqlite3.Connection]:
+    """
+    One short-lived autocommit connection per operation: callers hop between
+    threads (asyncio.to_thread) and sqlite3 connections don't. Rows come
+    back as sqlite3.Row.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def init_database(path: Path, schema: str) -> None:
+    """Create `schema` in WAL mode, so readers in other processes don't block the writer."""
+    with connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(schema)
@@ -0,0 +1,189 @@
+"""
+Tiled extraction for tall, scrolling schedule screenshots.
+
+A projection profile (per-row intensity spread) finds the horizontal bands
+between table rows: blank gaps and ruled grid lines are both near-uniform
+rows. We cut there into overlapping tiles so every table row is whole in at
+least one tile, extract tiles concurrently, then merge the rows and drop
+the duplicates that the overlaps produce at the seams. The column-header
+band at the top of the page is repeated above every later tile so the model
+still knows which column is which.
+"""
+from __future__ import annotations
+import io
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .parser import normalize_days
+from .schema import normalize_time_string
+
+DEFAULT_MIN_HEIGHT = 2400     # px; shorter screenshots go to the model whole
+DEFAULT_MIN_ASPECT = 1.5      # height / width
+DEFAULT_TARGET_HEIGHT = 1400  # px per tile before overlap
+DEFAULT_OVERLAP = 120         # px added above and below each seam
+DEFAULT_HEADER_MAX = 320      # px; a taller first block isn't treated as a header
+_SMOOTH = 9                   # rows in the profile smoothing window
+
+
+def row_profile(gray: np.ndarray) -> np.ndarray:
+    """Per-row standard deviation, smoothed: low values are separator bands."""
+    spread = gray.astype(np.float32).std(axis=1)
+    kernel = np.ones(_SMOOTH, dtype=np.float32) / _SMOOTH
+    return np.convolve(spread, kernel, mode="same")
+
+
+def plan_tiles(
+    profile: np.ndarray,
+    target_height: int = DEFAULT_TARGET_HEIGHT,
+    overlap: int = DEFAULT_OVERLAP,
+) -> List[Tuple[int, int]]:
+    """
+    Choose cut rows near every `target_height` px, each at the calmest row of
+    the last quarter of the span, and return (top, bottom) boxes that extend
+    `overlap` px past each cut.
+    """
+    height = len(profile)
+    cuts: List[int] = []
+    start = 0
+    while height - start > target_height * 1.25:
+        lo = start + int(target_height * 0.75)
+        hi = start + target_height
+        cut = lo + int(np.argmin(profile[lo:hi]))
+        cuts.append(cut)
+        start = cut
+    bounds = [0] + cuts + [height]
+    return [
+        (max(0, top - overlap if i else top), min(height, bottom + overlap))
+        for i, (top, bottom) in enumerate(zip(bounds, bounds[1:]))
+    ]
+
+
+def header_band(profile: np.ndarray, max_height: int = DEFAULT_HEADER_MAX) -> int:
+    """
+    Bottom row of the first content block (the column headings), or 0 if
+    the page doesn't start with a block of at most `max_height` px.
+    """
+    lo = float(profile.min())
+    calm = profile <= lo + 0.1 * (float(np.percentile(profile, 90)) - lo)
+    content = np.flatnonzero(~calm[:max_height])
+    if not len(content):
+        return 0
+    after = np.flatnonzero(calm[content[0]:max_height])
+    return int(content[0] + after[0]) if len(after) else 0
+
+
+def split_tiles(
+    image_bytes: bytes,
+    min_height: int = DEFAULT_MIN_HEIGHT,
+    min_aspect: float = DEFAULT_MIN_ASPECT,
+    target_height: int = DEFAULT_TARGET_HEIGHT,
+    overlap: int = DEFAULT_OVERLAP,
+) -> Optional[List[bytes]]:
+    """PNG tiles for a tall screenshot, or None if it should be sent whole."""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except Exception:
+        return None  # not a raster image (e.g. PDF); let the caller decide
+    width, height = image.size
+    if height < min_height or height < width * min_aspect:
+        return None
+
+    profile = row_profile(np.asarray(image.convert("L")))
+    boxes = plan_tiles(profile, target_height, overlap)
+    if len(boxes) < 2:
+        return None
+    header = header_band(profile)
+    if header and image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGBA")  # so composited tiles keep their colours
+    tiles: List[bytes] = []
+    for top, bottom in boxes:
+        tile = image.crop((0, top, width, bottom))
+        if top >= header > 0:
+            with_header = Image.new(image.mode, (width, header + bottom - top))
+            with_header.paste(image.crop((0, 0, width, header)), (0, 0))
+            with_header.paste(tile, (0, header))
+            tile = with_header
+        buf = io.BytesIO()
+        tile.save(buf, format="PNG")
+        tiles.append(buf.getvalue())
+    return tiles
+
+
+def _norm_text(value: Any) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def _norm_time(value: Any) -> str:
+    try:
+        return normalize_time_string(str(value))
+    except ValueError:
+        return _norm_text(value)
+
+
+def _norm_days(value: Any) -> Tuple:
+    tokens = value if isinstance(value, list) else [str(value or "")]
+    tokens = [t for tok in tokens for t in re.split(r"[,\s/]+", str(tok)) if t]
+    return tuple(sorted(normalize_days(tokens)))
+
+
+def _row_key(item: Dict[str, Any]) -> Tuple:
+    return (
+        _norm_text(item.get("title")),
+        _norm_days(item.get("days", item.get("day"))),
+        _norm_time(item.get("start_time")),
+        _norm_time(item.get("end_time")),
+    )
+
+
+def _same_row(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    if _row_key(a) != _row_key(b):
+        return False
+    terms = _norm_text(a.get("termLabel")), _norm_text(b.get("termLabel"))
+    return not all(terms) or terms[0] == terms[1]
+
+
+def _seam(previous: List[Dict[str, Any]], rows: List[Dict[str, Any]]) -> Tuple[int, int, int]:
+    """
+    Longest run where the head of `rows` repeats the tail of `previous`, as
+    (start in previous, start in rows, length). Either edge may carry one
+    extra row the other tile only saw cut off.
+    """
+    best = (0, 0, 0)
+    for tail_skip in (0, 1):
+        for head_skip in (0, 1):
+            for k in range(min(len(previous) - tail_skip, len(rows) - head_skip), best[2], -1):
+                start = len(previous) - tail_skip - k
+                if all(_same_row(previous[start + i], rows[head_skip + i]) for i in range(k)):
+                    best = (start, head_skip, k)
+                    break
+    return best
+
+
+def merge_rows(tile_results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Concatenate rows in tile order, folding the duplicates an overlap
+    produces: the head of each tile that repeats the tail of the tile before
+    it. Fields one copy lost at the tile edge are filled in from the other,
+    keeping the longer value. Matching rows anywhere else on the page (the
+    same class listed for two terms, say) are kept.
+    """
+    merged: List[Dict[str, Any]] = []
+    previous: List[Dict[str, Any]] = []
+    for rows in tile_results:
+        rows = [dict(item) for item in rows if isinstance(item, dict)]
+        start, head, length = _seam(previous, rows)
+        for i, item in enumerate(rows):
+            if not head <= i < head + length:
+                merged.append(item)
+                continue
+            existing = previous[start + i - head]
+            for field, value in item.items():
+                if value and len(_norm_text(value)) > len(_norm_text(existing.get(field))):
+                    existing[field] = value
+            rows[i] = existing
+        previous = rows
+    return merged
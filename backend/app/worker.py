@@ -0,0 +1,103 @@
+"""
+Extraction worker process.
+
+    python -m app.worker --concurrency 4
+
+Pulls jobs from the SQLite queue (app.jobs), runs them through the same
+coalescing/resilient Gemini path as the web routes and stores the result.
+Run as many processes as model throughput allows, independent of uvicorn.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from .extraction import build_extract_response
+from .jobs import Job, JobQueue, get_queue
+from .llm_gemini import extract_from_image_shared
+
+log = logging.getLogger("schedulify.worker")
+
+DEFAULT_POLL_INTERVAL = 1.0
+PURGE_AFTER_SECONDS = 24 * 3600
+PURGE_EVERY = 600  # claims or idle polls per worker loop between purges
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value) if value else None
+
+
+async def _keep_leased(queue: JobQueue, job: Job) -> None:
+    # Renew well before expiry so a slow model call isn't re-claimed and run
+    # a second time by another worker.
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not await asyncio.to_thread(queue.renew, job.id, job.lease_token):
+            log.warning("job %s: lease lost, result will be discarded", job.id)
+            return
+
+
+async def process_job(queue: JobQueue, job: Job) -> None:
+    params = job.params
+    renewer = asyncio.ensure_future(_keep_leased(queue, job))
+    try:
+        raw = await extract_from_image_shared(job.image or b"", scope=params.get("scope"))
+        response = build_extract_response(
+            raw,
+            _parse_date(params.get("start_date")),
+            _parse_date(params.get("end_date")),
+            params.get("timezone"),
+        )
+    except Exception as exc:
+        log.warning("job %s failed: %s", job.id, exc)
+        recorded = await asyncio.to_thread(queue.fail, job.id, job.lease_token, str(exc))
+    else:
+        recorded = await asyncio.to_thread(queue.complete, job.id, job.lease_token, response.model_dump_json())
+    finally:
+        renewer.cancel()
+    if not recorded:
+        log.warning("job %s: lease no longer held, outcome dropped", job.id)
+
+
+async def _worker_loop(queue: JobQueue, poll_interval: float, purge_every: int = PURGE_EVERY) -> None:
+    polls = 0
+    while True:
+        # Long-running workers keep the queue file bounded, not just at start.
+        if polls % purge_every == 0:
+            await asyncio.to_thread(queue.purge, PURGE_AFTER_SECONDS)
+        polls += 1
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            await asyncio.sleep(poll_interval)
+            continue
+        await process_job(queue, job)
+
+
+async def run_worker(queue: JobQueue, concurrency: int, poll_interval: float = DEFAULT_POLL_INTERVAL) -> None:
+    await asyncio.gather(*(_worker_loop(queue, poll_interval) for _ in range(concurrency)))
+
+
+def main(argv: Optional[list] = None) -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run Schedulify extraction workers.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("JOB_WORKER_CONCURRENCY") or 4),
+        help="jobs processed at once by this process",
+    )
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    log.info("worker %s started (concurrency=%d)", os.getpid(), args.concurrency)
+    asyncio.run(run_worker(get_queue(), args.concurrency, args.poll_interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Encode time and wire size for large synthetic schedules.
+
+    cd backend && python -m benchmarks.bench_responses [--events 2000]
+
+Compares FastAPI's JSON paths for a response_model route: the classic
+jsonable_encoder + json.dumps, the Pydantic dump_json fast path FastAPI
+>= 0.130 uses with the default response class, and model_dump + orjson (what
+an ORJSONResponse default would do, if orjson is installed). Then the
+gzip/brotli sizes the CompressionMiddleware would send for the JSON and for
+the matching text/calendar export.
+"""
+from __future__ import annotations
+import argparse
+import time
+from datetime import date
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.compression import brotli, compress
+from app.ics import build_ics
+from app.schema import EventRow, ExtractResponse
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+DAYS = [["MO", "WE", "FR"], ["TU", "TH"], ["MO"], ["WE"], ["FR"], ["SA"]]
+
+
+def synthetic_schedule(n: int) -> ExtractResponse:
+    events = [
+        EventRow(
+            title=f"DEPT {100 + i % 400} - Course number {i} with a realistic title",
+            days=DAYS[i % len(DAYS)],
+            start_time=f"{8 + i % 10:02d}:{(i * 5) % 60:02d}",
+            end_time=f"{9 + i % 10:02d}:{(i * 5) % 60:02d}",
+            location=f"Building {i % 25} Room {100 + i % 300}",
+            instructor=f"Instructor {i % 97}",
+            notes=f"Section {i % 12:02d}",
+            start_date=date(2025, 1, 21),
+            end_date=date(2025, 5, 16),
+            termLabel="Spring 2025",
+        )
+        for i in range(n)
+    ]
+    return ExtractResponse(
+        events=events,
+        timezone="America/Los_Angeles",
+        inferred_start=date(2025, 1, 21),
+        inferred_end=date(2025, 5, 16),
+    )
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    resp = synthetic_schedule(args.events)
+    adapter = TypeAdapter(ExtractResponse)
+
+    print(f"Synthetic schedule: {args.events} events\n")
+    print("JSON encode (ms, best of %d)" % args.repeat)
+    stdlib = best_of(lambda: JSONResponse(jsonable_encoder(resp)), args.repeat)
+    dump_json = best_of(lambda: adapter.dump_json(resp), args.repeat)
+    print(f"  jsonable_encoder + json.dumps : {stdlib:8.2f}")
+    print(f"  TypeAdapter.dump_json         : {dump_json:8.2f}   ({stdlib / dump_json:.1f}x faster)")
+    if orjson is not None:
+        # An ORJSONResponse default makes FastAPI model_dump first, then render.
+        via_orjson = best_of(lambda: orjson.dumps(resp.model_dump(mode="json")), args.repeat)
+        print(f"  model_dump + orjson.dumps     : {via_orjson:8.2f}   ({stdlib / via_orjson:.1f}x faster)")
+
+    bodies = {
+        "application/json": adapter.dump_json(resp),
+        "text/calendar": build_ics(resp.events, resp.timezone, resp.inferred_start, resp.inferred_end),
+    }
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    print("\nWire size (bytes) / compress time (ms)")
+    for media_type, body in bodies.items():
+        print(f"  {media_type:<17} identity {len(body):>10,}")
+        for enc in encodings:
+            ms = best_of(lambda: compress(body, enc), args.repeat)
+            size = len(compress(body, enc))
+            print(f"  {'':<17} {enc:<8} {size:>10,}  {100 * (1 - size / len(body)):5.1f}% smaller  {ms:7.2f} ms")
+    if brotli is None:
+        print("\n(brotli not installed; pip install brotli to compare)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import gzip
+
+import pytest
+
+from app import compression
+from app.compression import CompressionMiddleware, choose_encoding
+
+pytest.importorskip("httpx")
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+
+
+def _client(minimum_size=100):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size)
+
+    @app.get("/big")
+    def big():
+        return {"events": [{"title": f"CS {i}", "days": ["MO", "WE"]} for i in range(50)]}
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/ics")
+    def ics():
+        return Response(b"BEGIN:VEVENT\r\n" * 100, media_type="text/calendar")
+
+    @app.get("/pregzipped")
+    def pregzipped():
+        body = gzip.compress(b"BEGIN:VCALENDAR" * 100)
+        return Response(body, media_type="text/calendar", headers={"Content-Encoding": "gzip"})
+
+    @app.get("/no-transform")
+    def no_transform():
+        return Response(b"BEGIN:VEVENT\r\n" * 100, media_type="text/calendar",
+                        headers={"Cache-Control": "private, no-transform"})
+
+    @app.get("/png")
+    def png():
+        return Response(b"\x89PNG" * 500, media_type="image/png")
+
+    return TestClient(app)
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") == ("br" if compression.brotli else "gzip")
+
+
+def test_json_and_calendar_bodies_are_compressed():
+    client = _client()
+    for path in ("/big", "/ics"):
+        resp = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip"
+        assert resp.headers["vary"] == "Accept-Encoding"
+        assert int(resp.headers["content-length"]) < len(resp.content)
+    assert client.get("/big", headers={"Accept-Encoding": "gzip"}).json()["events"][49]["title"] == "CS 49"
+
+
+def test_small_binary_and_precompressed_bodies_pass_through():
+    client = _client()
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/png", headers={"Accept-Encoding": "gzip"}).headers
+    resp = client.get("/pregzipped", headers={"Accept-Encoding": "gzip"})
+    assert resp.content == b"BEGIN:VCALENDAR" * 100
+    assert "content-encoding" not in client.get("/no-transform", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_brotli_when_preferred():
+    pytest.importorskip("brotli")
+    resp = _client().get("/big", headers={"Accept-Encoding": "gzip;q=0.5, br"})
+    assert resp.headers["content-encoding"] == "br"
+
+
+def test_response_model_routes_keep_the_dump_json_fast_path():
+    # FastAPI only serializes straight to JSON bytes with the default
+    # response class; a custom default would re-add a dict round trip.
+    from fastapi.datastructures import DefaultPlaceholder
+    from fastapi.routing import APIRoute
+    from app import main
+
+    routes = [r for r in main.app.routes if isinstance(r, APIRoute) and r.response_model]
+    assert routes
+    assert all(isinstance(r.response_class, DefaultPlaceholder) for r in routes)
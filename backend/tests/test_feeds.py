@@ -0,0 +1,112 @@
+import gzip
+
+import pytest
+
+from app.feeds import FeedStore, accepts_gzip, hash_token, not_modified, token_matches
+
+PAYLOAD = {
+    "events": [
+        {"title": "CS 101", "days": ["MO", "WE"], "start_time": "09:00", "end_time": "10:15"},
+    ],
+    "timezone": "America/Los_Angeles",
+    "start_date": "2025-01-27",
+    "end_date": "2025-05-16",
+}
+
+
+def test_store_round_trip_and_precompression(tmp_path):
+    store = FeedStore(tmp_path / "feeds.sqlite3")
+    saved = store.save("abc", "{}", b"BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n", None, hash_token("secret"))
+    assert gzip.decompress(saved.ics_gz) == saved.ics
+    assert token_matches(saved, "secret") and not token_matches(saved, "guess")
+    assert saved.token_hash != "secret"
+
+    # A fresh store (another worker) sees the same pre-rendered feed.
+    other = FeedStore(tmp_path / "feeds.sqlite3").get("abc")
+    assert other == saved
+    assert store.delete("abc") and store.get("abc") is None
+
+
+def test_conditional_get_helpers(tmp_path):
+    feed = FeedStore(tmp_path / "feeds.sqlite3").save("abc", "{}", b"ics")
+    assert not_modified(feed, feed.etag, None)
+    assert not_modified(feed, f'W/{feed.gzip_etag}, "other"', None)
+    assert not not_modified(feed, '"other"', feed.last_modified)  # ETag takes precedence
+    assert not_modified(feed, None, feed.last_modified)
+    assert not not_modified(feed, None, "Mon, 01 Jan 2001 00:00:00 GMT")
+    assert accepts_gzip("br, gzip;q=0.8")
+    assert not accepts_gzip("gzip;q=0, identity")
+
+
+def test_feed_endpoints_serve_cached_bytes(tmp_path, monkeypatch):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from app import feeds, main
+
+    monkeypatch.setattr(feeds, "_store", FeedStore(tmp_path / "feeds.sqlite3"))
+    client = TestClient(main.app)
+
+    created = client.post("/feeds", json=PAYLOAD)
+    assert created.status_code == 201
+    path = created.json()["path"]
+    big_path = client.post("/feeds", json={**PAYLOAD, "events": PAYLOAD["events"] * 20}).json()["path"]
+
+    def boom(*args, **kwargs):
+        raise AssertionError("feed polls must not re-render")
+
+    monkeypatch.setattr(main, "build_ics", boom)
+    monkeypatch.setattr(main, "build_ics_update", boom)
+    first = client.get(path, headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200
+    assert first.headers["content-encoding"] == "gzip"
+    assert b"SUMMARY:CS 101" in first.content  # client transparently decoded it
+
+    again = client.get(path, headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304 and again.content == b""
+
+    # A br-only client gets the identity bytes under the identity ETag, not
+    # a per-poll brotli re-encode of them.
+    gzipped = client.get(big_path, headers={"Accept-Encoding": "gzip"})
+    plain = client.get(big_path, headers={"Accept-Encoding": "identity"})
+    br_only = client.get(big_path, headers={"Accept-Encoding": "br"})
+    assert "content-encoding" not in br_only.headers
+    assert br_only.headers["etag"] == plain.headers["etag"] != gzipped.headers["etag"]
+    assert br_only.content == plain.content
+
+    assert client.get("/feeds/missing.ics").status_code == 404
+
+
+def test_feed_edits_need_the_edit_token_and_keep_uids(tmp_path, monkeypatch):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from icalendar import Calendar
+    from app import feeds, main
+
+    monkeypatch.setattr(feeds, "_store", FeedStore(tmp_path / "feeds.sqlite3"))
+    client = TestClient(main.app)
+
+    created = client.post("/feeds", json=PAYLOAD).json()
+    feed_id, token = created["id"], created["edit_token"]
+    assert token and token not in (tmp_path / "feeds.sqlite3").read_bytes().decode("latin-1")
+
+    def events(path):
+        cal = Calendar.from_ical(client.get(path).content)
+        return {str(ev["uid"]): int(ev.get("sequence", 0)) for ev in cal.walk("VEVENT")}
+
+    before = events(created["path"])
+
+    edited = dict(PAYLOAD, events=[dict(PAYLOAD["events"][0], location="Room 9")])
+    assert client.put(f"/feeds/{feed_id}", json=edited).status_code == 403
+    assert client.put(
+        f"/feeds/{feed_id}", json=edited, headers={"Authorization": f"Bearer {feed_id}"}
+    ).status_code == 403
+    auth = {"Authorization": f"Bearer {token}"}
+    updated = client.put(f"/feeds/{feed_id}", json=edited, headers=auth)
+    assert updated.status_code == 200 and updated.json()["edit_token"] is None
+
+    after = events(created["path"])
+    assert after.keys() == before.keys()  # same UIDs, so clients update in place
+    assert all(seq == 1 for seq in after.values())
+
+    assert client.delete(f"/feeds/{feed_id}").status_code == 403
+    assert client.delete(f"/feeds/{feed_id}", headers=auth).status_code == 204
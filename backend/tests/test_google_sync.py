@@ -0,0 +1,186 @@
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.google import build_google_event
+from app.google_sync import GoogleCalendarClient, SyncStateStore, plan_sync, sync_events, sync_scope
+from app.schema import EventRow
+
+
+class FakeCalendar:
+    """Local stand-in for the Calendar v3 batch endpoint."""
+
+    def __init__(self):
+        self.events = {}
+        self.batches = []
+        self.connections = set()
+        self.owners = {"token": "me@example.com", "other-token": "them@example.com"}
+
+    def handle(self, method, path, body):
+        event_id = path.rsplit("/", 1)[-1]
+        if method == "POST":
+            if body["id"] in self.events:
+                return 409
+            self.events[body["id"]] = body
+            return 200
+        if event_id not in self.events:
+            return 404
+        if method == "PUT":
+            self.events[event_id] = body
+            return 200
+        del self.events[event_id]
+        return 204
+
+
+def _handler(cal):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            owner = cal.owners.get(self.headers["Authorization"].split(" ", 1)[1])
+            calendar_id = self.path.rsplit("/", 1)[-1]
+            if owner is None:
+                self.send_response(401)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = json.dumps({"id": owner if calendar_id == "primary" else calendar_id}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            cal.connections.add(self.client_address)
+            boundary = self.headers["Content-Type"].split("boundary=")[1]
+            raw = self.rfile.read(int(self.headers["Content-Length"])).decode()
+            out_boundary = f"resp_{uuid.uuid4().hex}"
+            out, ops = [], 0
+            for part in raw.split(f"--{boundary}"):
+                if "Content-ID" not in part:
+                    continue
+                headers, _, inner = part.partition("\r\n\r\n")
+                cid = headers.split("Content-ID: <")[1].split(">")[0]
+                request_line, _, rest = inner.partition("\r\n")
+                method, path, _ = request_line.split(" ")
+                payload = rest.partition("\r\n\r\n")[2].strip()
+                status = cal.handle(method, path, json.loads(payload) if payload else None)
+                ops += 1
+                out.append(
+                    f"--{out_boundary}\r\nContent-Type: application/http\r\n"
+                    f"Content-ID: <response-{cid}>\r\n\r\nHTTP/1.1 {status} X\r\n\r\n{{}}\r\n"
+                )
+            cal.batches.append(ops)
+            data = ("".join(out) + f"--{out_boundary}--\r\n").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/mixed; boundary={out_boundary}")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+@pytest.fixture
+def calendar():
+    cal = FakeCalendar()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(cal))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    cal.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield cal
+    server.shutdown()
+
+
+def _rows(n, overrides=None):
+    rows = []
+    for i in range(n):
+        data = dict(
+            title=f"CS {100 + i}",
+            days=["MO", "WE"],
+            start_time="09:00",
+            end_time="10:15",
+            start_date="2025-01-27",
+            end_date="2025-05-16",
+        )
+        data.update((overrides or {}).get(i, {}))
+        rows.append(EventRow(**data))
+    return rows
+
+
+def test_first_meeting_anchors_start():
+    ev = {"days": ["TU", "TH"], "start_date": "2025-01-27", "end_date": "2025-03-02",
+          "start_time": "09:00", "end_time": "10:15"}
+    body = build_google_event(ev, "UTC")
+    assert body["start"]["dateTime"] == "2025-01-28T09:00:00"
+    assert body["recurrence"] == ["RRULE:FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20250302T235959Z"]
+
+
+def test_until_covers_the_last_local_day():
+    # A 6pm Los Angeles class on the last day is 02:00Z the next day; a UTC
+    # end-of-day UNTIL would drop it.
+    ev = {"days": ["FR"], "start_date": "2025-01-27", "end_date": "2025-05-16",
+          "start_time": "18:00", "end_time": "19:15"}
+    body = build_google_event(ev, "America/Los_Angeles")
+    assert body["recurrence"] == ["RRULE:FREQ=WEEKLY;BYDAY=FR;UNTIL=20250517T065959Z"]
+
+
+def test_resync_sends_only_the_delta(calendar, tmp_path):
+    client = GoogleCalendarClient("token", base_url=calendar.url)
+    store = SyncStateStore(tmp_path)
+
+    first = sync_events(client, _rows(60), "UTC", store.load("me"), "me")
+    store.save("me", first.state)
+    assert (first.created, first.errors) == (60, [])
+    assert calendar.batches == [50, 10]
+    assert len(calendar.events) == 60
+
+    edited = _rows(59, {3: {"location": "Room 9"}})
+    second = sync_events(client, edited, "UTC", store.load("me"), "me")
+    assert (second.created, second.updated, second.deleted, second.unchanged) == (0, 1, 1, 58)
+    assert calendar.batches[-1] == 2
+    assert len(calendar.events) == 59
+    assert len(calendar.connections) == 1  # one keep-alive connection throughout
+
+
+def test_lost_state_falls_back_to_update(calendar):
+    client = GoogleCalendarClient("token", base_url=calendar.url)
+    sync_events(client, _rows(2), "UTC", {}, "me")
+    again = sync_events(client, _rows(2), "UTC", {}, "me")
+    assert (again.created, again.updated, again.errors) == (0, 2, [])
+
+
+def test_rows_without_days_are_skipped():
+    ops, unchanged = plan_sync(_rows(2, {1: {"days": []}}), "UTC", {}, "me")
+    assert [op.kind for op in ops] == ["create"] and unchanged == 0
+
+
+def test_scope_comes_from_the_token_not_the_caller(calendar, monkeypatch, tmp_path):
+    pytest.importorskip("httpx")
+    from functools import partial
+    from fastapi.testclient import TestClient
+    from app import main
+
+    assert sync_scope(GoogleCalendarClient("token", base_url=calendar.url)) == "me@example.com"
+
+    monkeypatch.setenv("SCHEDULIFY_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "GoogleCalendarClient", partial(GoogleCalendarClient, base_url=calendar.url))
+    client = TestClient(main.app)
+    payload = {"events": [r.model_dump(mode="json") for r in _rows(3)], "timezone": "UTC"}
+    assert client.post("/google/sync", json={**payload, "access_token": "token"}).json()["created"] == 3
+
+    # Another token claiming the same account gets its own state and ids.
+    spoofed = {**payload, "access_token": "other-token", "account": "me@example.com"}
+    assert client.post("/google/sync", json=spoofed).json()["created"] == 3
+    assert len(calendar.events) == 6
+    store = SyncStateStore()
+    assert len(store.load("me@example.com")) == len(store.load("them@example.com")) == 3
+
+    assert client.post("/google/sync", json={**payload, "access_token": "bad"}).status_code == 401
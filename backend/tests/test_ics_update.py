@@ -0,0 +1,75 @@
+from datetime import date
+
+from icalendar import Calendar
+
+from app.ics import build_ics_update
+from app.schema import EventRow
+
+START, END = date(2025, 1, 27), date(2025, 5, 16)
+
+
+def _rows():
+    return [
+        EventRow(title="CS 101", days=["MO", "WE"], start_time="09:00", end_time="10:15"),
+        EventRow(title="CS 101", days=["FR"], start_time="13:00", end_time="15:00", notes="Lab"),
+        EventRow(title="MATH 200", days=["TU", "TH"], start_time="11:00", end_time="12:15"),
+    ]
+
+
+def _vevents(data: bytes):
+    out = []
+    for cal in Calendar.from_ical(data, multiple=True):
+        for ev in cal.walk("VEVENT"):
+            out.append((str(cal.get("method")), ev))
+    return out
+
+
+def test_first_export_is_full_with_stable_uids():
+    first = build_ics_update(_rows(), "UTC", START, END)
+    assert (first.created, first.updated, first.cancelled) == (5, 0, 0)
+    again = build_ics_update(_rows(), "UTC", START, END, previous=first.state)
+    assert (again.created, again.updated, again.cancelled, again.unchanged) == (0, 0, 0, 5)
+    assert _vevents(again.ics) == []
+
+
+def test_edit_emits_only_changed_events_with_bumped_sequence():
+    first = build_ics_update(_rows(), "UTC", START, END)
+    rows = _rows()
+    rows[0] = rows[0].model_copy(update={"location": "Room 9"})
+    second = build_ics_update(rows, "UTC", START, END, previous=first.state)
+
+    assert (second.created, second.updated, second.unchanged) == (0, 2, 3)
+    emitted = _vevents(second.ics)
+    assert len(emitted) == 2
+    first_uids = {e.uid for e in first.state.events}
+    for method, ev in emitted:
+        assert method == "PUBLISH"
+        assert str(ev["uid"]) in first_uids
+        assert ev["sequence"] == 1
+
+
+def test_removed_rows_are_cancelled():
+    first = build_ics_update(_rows(), "UTC", START, END)
+    rows = _rows()
+    del rows[2]  # drop MATH 200 (TU + TH)
+    second = build_ics_update(rows, "UTC", START, END, previous=first.state)
+
+    assert second.cancelled == 2
+    cancels = [ev for method, ev in _vevents(second.ics) if method == "CANCEL"]
+    assert len(cancels) == 2
+    assert all(str(ev["status"]) == "CANCELLED" and ev["sequence"] == 1 for ev in cancels)
+    assert len(second.state.events) == 3
+    assert [m for m, _ in _vevents(second.ics)] == ["CANCEL", "CANCEL"]
+    assert b"METHOD:PUBLISH" not in second.ics  # removals only: no empty PUBLISH object
+
+
+def test_cancel_dtstart_keeps_the_named_timezone():
+    tz = "America/Los_Angeles"
+    first = build_ics_update(_rows(), tz, START, END)
+    assert first.state.events[0].dtstart == "2025-01-27T09:00:00"
+    second = build_ics_update(_rows()[:1], tz, START, END, previous=first.state)
+
+    assert second.cancelled == 3
+    assert b"DTSTART;TZID=America/Los_Angeles:20250131T130000\r\n" in second.ics
+    assert b"DTSTART;TZID=America/Los_Angeles:20250128T110000\r\n" in second.ics
+    assert b"UTC-08:00" not in second.ics
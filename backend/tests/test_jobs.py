@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from app import worker
+from app.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+from app.schema import ExtractResponse
+
+
+def test_enqueue_claim_complete(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    job_id = q.enqueue(b"png-bytes", {"timezone": "UTC"})
+    assert q.get(job_id).status == QUEUED
+
+    job = q.claim()
+    assert job.id == job_id and job.image == b"png-bytes" and job.attempts == 1
+    assert q.get(job_id).status == RUNNING
+    assert q.claim() is None
+
+    assert q.complete(job_id, job.lease_token, '{"events": [], "timezone": "UTC"}')
+    done = q.get(job_id)
+    assert done.status == DONE and done.result.startswith("{")
+
+
+def test_jobs_survive_restart_and_expired_leases_are_reclaimed(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    before = JobQueue(path, lease_seconds=0.01)
+    job_id = before.enqueue(b"x", {})
+    assert before.claim().id == job_id  # claimed, then the "worker" dies
+
+    time.sleep(0.02)
+    restarted = JobQueue(path, lease_seconds=60)
+    reclaimed = restarted.claim()
+    assert reclaimed.id == job_id and reclaimed.attempts == 2
+
+
+def test_only_the_current_lease_holder_can_finish_a_job(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=0.01)
+    job_id = q.enqueue(b"x", {})
+    stale = q.claim()
+    time.sleep(0.02)
+    current = q.claim()
+    assert current.id == job_id and current.lease_token != stale.lease_token
+
+    # The first worker finally gives up (or finishes) after losing its lease.
+    assert not q.renew(job_id, stale.lease_token)
+    assert not q.fail(job_id, stale.lease_token, "timeout")
+    assert q.get(job_id).status == RUNNING
+
+    assert q.renew(job_id, current.lease_token)
+    assert q.complete(job_id, current.lease_token, "{}")
+    assert not q.fail(job_id, current.lease_token, "late")  # outcome is final
+    assert q.get(job_id).status == DONE
+
+
+def test_repeatedly_abandoned_job_is_failed(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=0, max_attempts=1)
+    job_id = q.enqueue(b"x", {})
+    assert q.claim().id == job_id
+    time.sleep(0.01)
+    assert q.claim() is None
+    assert q.get(job_id).status == FAILED
+
+
+def test_worker_stores_extract_response(tmp_path, monkeypatch):
+    async def fake_extract(image_bytes, ocr_hint=None, scope=None):
+        return [{"title": "CS 101", "days": "MW", "start_time": "9:00AM", "end_time": "10:15AM"}]
+
+    monkeypatch.setattr(worker, "extract_from_image_shared", fake_extract)
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    job_id = q.enqueue(b"x", {"start_date": "2025-01-27", "end_date": "2025-03-02", "timezone": "UTC"})
+
+    asyncio.run(worker.process_job(q, q.claim()))
+
+    job = q.get(job_id)
+    assert job.status == DONE
+    result = ExtractResponse.model_validate_json(job.result)
+    assert result.events[0].days == ["MO", "WE"]
+    assert not result.needs_dates
+
+
+def test_worker_renews_lease_during_long_calls(tmp_path, monkeypatch):
+    async def slow_extract(image_bytes, ocr_hint=None, scope=None):
+        await asyncio.sleep(0.3)
+        return []
+
+    monkeypatch.setattr(worker, "extract_from_image_shared", slow_extract)
+    q = JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=0.1)
+    job_id = q.enqueue(b"x", {"timezone": "UTC"})
+
+    async def main():
+        running = asyncio.ensure_future(worker.process_job(q, q.claim()))
+        await asyncio.sleep(0.2)
+        assert await asyncio.to_thread(q.claim) is None  # lease was renewed, not expired
+        await running
+
+    asyncio.run(main())
+    assert q.get(job_id).status == DONE
+
+
+def test_worker_records_failures(tmp_path, monkeypatch):
+    async def broken(image_bytes, ocr_hint=None, scope=None):
+        raise RuntimeError("Could not parse JSON from model response")
+
+    monkeypatch.setattr(worker, "extract_from_image_shared", broken)
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    job_id = q.enqueue(b"x", {})
+
+    asyncio.run(worker.process_job(q, q.claim()))
+
+    job = q.get(job_id)
+    assert job.status == FAILED and "Could not parse" in job.error
+
+
+def test_worker_loop_purges_periodically(tmp_path, monkeypatch):
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    purges = []
+    monkeypatch.setattr(q, "purge", lambda older_than: purges.append(older_than) or 0)
+
+    async def main():
+        loop = asyncio.ensure_future(worker._worker_loop(q, poll_interval=0.01, purge_every=5))
+        await asyncio.sleep(0.3)
+        loop.cancel()
+
+    asyncio.run(main())
+    assert len(purges) >= 2  # not only at start
@@ -0,0 +1,115 @@
+import io
+import os
+import time
+
+from PIL import Image, ImageDraw
+
+from app import phash
+from app.phash import BKTree, NearDuplicateIndex, fingerprint, hamming, same_content
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "ss1.png")
+
+
+def _encode(image, fmt="PNG", **kwargs):
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def _recapture(image):
+    """Same page again: new status-bar clock, a few px of crop, JPEG re-encode."""
+    shot = image.copy()
+    ImageDraw.Draw(shot).text((shot.width - 40, 2), "12:07", fill=(0, 0, 0))
+    shot = shot.crop((2, 3, shot.width - 2, shot.height - 5))
+    return _encode(shot, "JPEG", quality=75)
+
+
+def _other_student(image):
+    """Same portal layout and font, different course code, time and room."""
+    shot = image.copy()
+    shot.paste(image.crop((20, 298, 116, 314)), (20, 85))     # CS 4661-01 -> CS 5660-01
+    shot.paste(image.crop((305, 287, 440, 303)), (305, 217))  # TuTh 12:15PM -> TuTh 4:30PM
+    shot.paste(image.crop((305, 330, 380, 346)), (305, 259))  # ET A406 -> ET A332
+    return shot
+
+
+def test_bktree_matches_linear_scan():
+    keys = [(i * 2654435761) & 0xFFFFFFFF for i in range(300)]
+    tree = BKTree()
+    for k in keys:
+        tree.add(k, k)
+    probe = keys[17] ^ 0b1011
+    expected = sorted((hamming(probe, k), k) for k in keys if hamming(probe, k) <= 6)
+    assert sorted(tree.search(probe, 6)) == expected
+
+
+def test_recaptured_screenshot_hits_and_other_pages_miss(tmp_path):
+    with open(SAMPLE, "rb") as f:
+        original = f.read()
+    image = Image.open(io.BytesIO(original)).convert("RGB")
+    index = NearDuplicateIndex(tmp_path / "phash.sqlite3")
+    rows = [{"title": "CS 101", "days": "MW"}]
+    index.add(fingerprint(original), "models/gemini-2.0-flash", "alice", rows)
+
+    assert index.lookup(fingerprint(_recapture(image)), "models/gemini-2.0-flash", "alice") == rows
+    # different model, different page, different aspect ratio
+    assert index.lookup(fingerprint(original), "models/other", "alice") is None
+    flipped = _encode(image.transpose(Image.Transpose.FLIP_TOP_BOTTOM))
+    assert index.lookup(fingerprint(flipped), "models/gemini-2.0-flash", "alice") is None
+    squashed = _encode(image.resize((image.width, image.height // 2)))
+    assert index.lookup(fingerprint(squashed), "models/gemini-2.0-flash", "alice") is None
+    # another session never sees alice's result, even for the very same image
+    assert index.lookup(fingerprint(original), "models/gemini-2.0-flash", "bob") is None
+
+
+def test_same_layout_with_different_text_misses(tmp_path):
+    with open(SAMPLE, "rb") as f:
+        original = f.read()
+    image = Image.open(io.BytesIO(original)).convert("RGB")
+    other = _encode(_other_student(image))
+    stored, candidate = fingerprint(original), fingerprint(other)
+    # The layout hashes can't tell the two apart...
+    assert hamming(stored.hash, candidate.hash) <= 8
+
+    index = NearDuplicateIndex(tmp_path / "phash.sqlite3")
+    index.add(stored, "m", "s", [{"title": "CS 4661-01"}])
+    assert index.lookup(candidate, "m", "s") is None
+    # ...while the pixel check still accepts real re-captures.
+    assert same_content(stored.pixels, fingerprint(_recapture(image)).pixels)
+    assert same_content(stored.pixels, fingerprint(_encode(image.resize((image.width * 2, image.height * 2)))).pixels)
+    # A single swapped digit is enough to miss.
+    one_digit = image.copy()
+    one_digit.paste(image.crop((366, 330, 374, 346)), (366, 259))
+    assert not same_content(stored.pixels, fingerprint(_recapture(one_digit)).pixels)
+
+
+def test_index_is_shared_between_workers(tmp_path):
+    with open(SAMPLE, "rb") as f:
+        original = f.read()
+    first = NearDuplicateIndex(tmp_path / "phash.sqlite3")
+    second = NearDuplicateIndex(tmp_path / "phash.sqlite3")
+    assert second.lookup(fingerprint(original), "m", "s") is None
+    first.add(fingerprint(original), "m", "s", [{"title": "X"}])
+    assert second.lookup(fingerprint(original), "m", "s") == [{"title": "X"}]
+
+
+def test_add_prunes_expired_entries_from_disk_and_trees(tmp_path, monkeypatch):
+    with open(SAMPLE, "rb") as f:
+        original = f.read()
+    flipped = _encode(Image.open(io.BytesIO(original)).transpose(Image.Transpose.FLIP_TOP_BOTTOM))
+    first, second = fingerprint(original), fingerprint(flipped)
+    monkeypatch.setattr(phash, "PRUNE_INTERVAL", 0.0)
+    index = NearDuplicateIndex(tmp_path / "phash.sqlite3", ttl_days=0.5 / 86400)
+    index.add(first, "m", "s", [{"title": "X"}])
+    assert index.lookup(first, "m", "s") == [{"title": "X"}]
+
+    time.sleep(0.6)
+    index.add(second, "m", "s", [{"title": "Y"}])
+    assert index.lookup(first, "m", "s") is None
+    assert sum(tree.size for tree in index._trees.values()) == 1
+    with phash.connect(index.path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0] == 1
+
+
+def test_non_images_have_no_fingerprint():
+    assert fingerprint(b"%PDF-1.4") is None
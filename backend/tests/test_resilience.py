@@ -0,0 +1,172 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.resilience import (
+    AIMDLimiter,
+    ResilientBackend,
+    RetryBudget,
+    RetryPolicy,
+    is_retryable,
+)
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def _fast_backend(**kwargs):
+    kwargs.setdefault("retry", RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001))
+    return ResilientBackend(**kwargs)
+
+
+def test_retryable_classification():
+    assert is_retryable(FakeAPIError(429))
+    assert is_retryable(FakeAPIError(503))
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(FakeAPIError(400))
+    assert not is_retryable(RuntimeError("Could not parse JSON"))
+
+
+def test_limiter_shrinks_on_429_and_grows_on_success():
+    async def main():
+        limiter = AIMDLimiter(initial=8, minimum=1, maximum=16)
+        started = await limiter.acquire()
+        await limiter.release(started, rate_limited=True, succeeded=False)
+        assert limiter.limit == 4
+        for _ in range(8):
+            await limiter.release(await limiter.acquire())
+        assert 5 < limiter.limit < 7
+        assert limiter.inflight == 0
+
+    asyncio.run(main())
+
+
+def test_burst_of_429s_decreases_once():
+    async def main():
+        limiter = AIMDLimiter(initial=8)
+        tokens = [await limiter.acquire() for _ in range(4)]
+        for t in tokens:
+            await limiter.release(t, rate_limited=True, succeeded=False)
+        assert limiter.limit == 4
+
+    asyncio.run(main())
+
+
+def test_retries_transient_errors_then_succeeds():
+    attempts = []
+
+    def flaky(model, timeout):
+        attempts.append(model)
+        if len(attempts) < 3:
+            raise FakeAPIError(503)
+        return ["ok"]
+
+    assert asyncio.run(_fast_backend().call(flaky, "primary")) == ["ok"]
+    assert attempts == ["primary"] * 3
+
+
+def test_does_not_retry_permanent_errors():
+    attempts = 0
+
+    def bad(model, timeout):
+        nonlocal attempts
+        attempts += 1
+        raise FakeAPIError(400)
+
+    with pytest.raises(FakeAPIError):
+        asyncio.run(_fast_backend().call(bad, "primary"))
+    assert attempts == 1
+
+
+def test_retry_budget_stops_retry_storm():
+    attempts = 0
+
+    def down(model, timeout):
+        nonlocal attempts
+        attempts += 1
+        raise FakeAPIError(503)
+
+    backend = _fast_backend(budget=RetryBudget(ratio=0.0, max_tokens=1))
+    with pytest.raises(FakeAPIError):
+        asyncio.run(backend.call(down, "primary"))
+    assert attempts == 2  # one retry, then the budget is empty
+
+
+def test_attempt_timeout_is_enforced():
+    def slow(model, timeout):
+        time.sleep(0.3)
+        return ["late"]
+
+    backend = _fast_backend(attempt_timeout=0.05, retry=RetryPolicy(max_attempts=1))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(backend.call(slow, "primary"))
+
+
+def test_hedge_to_secondary_model_wins_when_primary_is_slow():
+    def call(model, timeout):
+        if model == "primary":
+            time.sleep(0.3)
+            return ["primary"]
+        return ["hedge"]
+
+    async def main():
+        backend = _fast_backend(hedge_model="lite", hedge_after=0.02)
+        t0 = time.monotonic()
+        assert await backend.call(call, "primary") == ["hedge"]
+        assert time.monotonic() - t0 < 0.25
+
+    asyncio.run(main())
+
+
+def test_abandoned_calls_hold_their_slot_until_the_thread_returns():
+    def call(model, timeout):
+        time.sleep(0.3 if model == "primary" else 0.0)
+        return [model]
+
+    async def main():
+        backend = _fast_backend(hedge_model="lite", hedge_after=0.02)
+        assert await backend.call(call, "primary") == ["lite"]
+        # The primary lost the race but its thread is still running.
+        assert backend.limiter.inflight == 1
+        await asyncio.sleep(0.4)
+        assert backend.limiter.inflight == 0
+
+        timed_out = _fast_backend(attempt_timeout=0.05, retry=RetryPolicy(max_attempts=1))
+        with pytest.raises(asyncio.TimeoutError):
+            await timed_out.call(call, "primary")
+        assert timed_out.limiter.inflight == 1
+        await asyncio.sleep(0.4)
+        assert timed_out.limiter.inflight == 0
+
+    asyncio.run(main())
+
+
+def test_model_calls_do_not_queue_behind_the_default_executor():
+    # More concurrent calls than the default executor has threads on a
+    # 1-cpu VM (5): none may time out while waiting for a thread, and short
+    # to_thread() work elsewhere must not wait behind them.
+    def call(model, timeout):
+        time.sleep(0.4)
+        return [model]
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(5))
+        backend = _fast_backend(
+            limiter=AIMDLimiter(initial=16, maximum=16),
+            attempt_timeout=0.5,
+            retry=RetryPolicy(max_attempts=1),
+        )
+        calls = asyncio.gather(*(backend.call(call, "primary") for _ in range(10)))
+        await asyncio.sleep(0.05)
+        t0 = time.monotonic()
+        await asyncio.to_thread(lambda: None)
+        assert time.monotonic() - t0 < 0.2
+        assert await calls == [["primary"]] * 10
+
+    asyncio.run(main())
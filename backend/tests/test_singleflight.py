@@ -0,0 +1,134 @@
+import asyncio
+import time
+import pytest
+
+from app.singleflight import FileLockStore, SingleFlight
+
+
+def test_concurrent_calls_share_one_invocation():
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return [{"title": "CS 101"}]
+
+    async def main():
+        sf = SingleFlight()
+        results = await asyncio.gather(*(sf.do("k", work) for _ in range(20)))
+        assert sf.inflight() == 0
+        return results
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert all(r == [{"title": "CS 101"}] for r in results)
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    calls = 0
+
+    async def boom():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model down")
+
+    async def main():
+        sf = SingleFlight()
+        results = await asyncio.gather(*(sf.do("k", boom) for _ in range(5)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await sf.do("k", boom)
+
+    asyncio.run(main())
+    assert calls == 2
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        sf = SingleFlight()
+        first = asyncio.ensure_future(sf.do("k", work))
+        second = asyncio.ensure_future(sf.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done"
+        assert first.cancelled()
+
+    asyncio.run(main())
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    cancelled = False
+
+    async def work():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    async def main():
+        sf = SingleFlight()
+        waiter = asyncio.ensure_future(sf.do("k", work))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+        assert sf.inflight() == 0
+
+    asyncio.run(main())
+    assert cancelled
+
+
+def test_file_store_hands_result_to_other_process(tmp_path):
+    # Two SingleFlight instances stand in for two uvicorn workers.
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"events": [1, 2]}
+
+    async def main():
+        a = SingleFlight(FileLockStore(tmp_path))
+        b = SingleFlight(FileLockStore(tmp_path))
+        return await asyncio.gather(a.do("k", work), b.do("k", work))
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert results == [{"events": [1, 2]}, {"events": [1, 2]}]
+
+
+def test_file_store_runs_unrelated_keys_concurrently(tmp_path):
+    # Pick two keys whose digests share a low byte, i.e. keys that a striped
+    # lock layout would have put behind the same lock file.
+    store = FileLockStore(tmp_path)
+    seen = {}
+    for i in range(1000):
+        key = f"k{i}"
+        first = seen.setdefault(store._digest(key)[-2:], key)
+        if first != key:
+            keys = (first, key)
+            break
+
+    async def work():
+        await asyncio.sleep(0.2)
+        return "done"
+
+    async def main():
+        a = SingleFlight(FileLockStore(tmp_path))
+        b = SingleFlight(FileLockStore(tmp_path))
+        started = time.monotonic()
+        results = await asyncio.gather(a.do(keys[0], work), b.do(keys[1], work))
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(main())
+    assert results == ["done", "done"]
+    assert elapsed < 0.35
+    assert not list(tmp_path.glob("*.lock"))  # holders clean up after themselves
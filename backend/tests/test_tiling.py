@@ -0,0 +1,146 @@
+import asyncio
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from app import llm_gemini
+from app.resilience import AIMDLimiter, ResilientBackend, RetryPolicy
+from app.tiling import header_band, merge_rows, plan_tiles, row_profile, split_tiles
+
+ROW, GAP = 90, 30  # px per synthetic table row and the blank band between rows
+
+
+def _tall_schedule(rows=60, width=800):
+    """White page with noisy 'text' rows separated by blank bands."""
+    rng = np.random.default_rng(0)
+    height = rows * (ROW + GAP)
+    page = np.full((height, width), 255, dtype=np.uint8)
+    for i in range(rows):
+        top = i * (ROW + GAP) + GAP
+        page[top:top + ROW] = rng.integers(0, 256, size=(ROW, width), dtype=np.uint8)
+    return page
+
+
+def _png(array):
+    buf = io.BytesIO()
+    Image.fromarray(array).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_cuts_land_between_rows_and_tiles_overlap():
+    page = _tall_schedule()
+    boxes = plan_tiles(row_profile(page), target_height=1400, overlap=120)
+    assert len(boxes) >= 4
+    assert boxes[0][0] == 0 and boxes[-1][1] == page.shape[0]
+    for (top, bottom), (next_top, _) in zip(boxes, boxes[1:]):
+        cut = next_top + 120
+        assert (cut % (ROW + GAP)) < GAP + 5  # inside (or at the edge of) a blank band
+        assert bottom - next_top == 240
+
+
+def test_short_or_wide_images_are_not_tiled():
+    assert split_tiles(_png(_tall_schedule(rows=10))) is None
+    assert split_tiles(b"%PDF-1.4 not an image") is None
+    tiles = split_tiles(_png(_tall_schedule()))
+    assert tiles and all(Image.open(io.BytesIO(t)).size[0] == 800 for t in tiles)
+
+
+def test_later_tiles_repeat_the_header_band():
+    page = _tall_schedule()
+    header = header_band(row_profile(page))
+    assert GAP + ROW <= header <= GAP + ROW + 10  # first row block plus smoothing
+
+    tiles = [np.asarray(Image.open(io.BytesIO(t))) for t in split_tiles(_png(page))]
+    assert (tiles[0][:header] == page[:header]).all()
+    for tile in tiles[1:]:
+        assert (tile[:header] == page[:header]).all()
+
+
+def _fake_backend(monkeypatch):
+    backend = ResilientBackend(
+        limiter=AIMDLimiter(initial=16),
+        retry=RetryPolicy(max_attempts=1),
+    )
+    monkeypatch.setattr(llm_gemini, "_backend", backend)
+
+
+def test_extract_splits_calls_tiles_concurrently_and_merges(monkeypatch):
+    _fake_backend(monkeypatch)
+    image = _png(_tall_schedule(rows=30))
+    tiles = split_tiles(image)
+    assert len(tiles) == 3
+    spans = {}
+
+    def fake_extract(image_bytes, ocr_hint, model, timeout):
+        i = tiles.index(image_bytes)
+        assert ocr_hint is None
+        started = time.monotonic()
+        time.sleep(0.2)
+        spans[i] = (started, time.monotonic())
+        # Neighbouring tiles both see the row at their shared seam.
+        return [
+            {"title": f"Row {i}", "days": "MW", "start_time": "9:00AM", "end_time": "9:50AM"},
+            {"title": f"Row {i + 1}", "days": "MW", "start_time": "9:00AM", "end_time": "9:50AM"},
+        ]
+
+    monkeypatch.setattr(llm_gemini, "extract_from_image", fake_extract)
+    rows = asyncio.run(llm_gemini._extract(image, "whole-page OCR", "model"))
+
+    assert sorted(spans) == [0, 1, 2]
+    assert max(s for s, _ in spans.values()) < min(e for _, e in spans.values())  # all overlapped
+    assert [r["title"] for r in rows] == ["Row 0", "Row 1", "Row 2", "Row 3"]
+
+
+def test_failed_tile_cancels_siblings_and_falls_back_to_whole_page(monkeypatch):
+    _fake_backend(monkeypatch)
+    image = _png(_tall_schedule(rows=30))
+    tiles = split_tiles(image)
+    events = []
+
+    def fake_extract(image_bytes, ocr_hint, model, timeout):
+        if image_bytes == image:
+            events.append("whole")
+            return [{"title": "Whole page"}]
+        if image_bytes == tiles[0]:
+            raise RuntimeError("Could not parse JSON from model response")
+        time.sleep(0.5)
+        events.append("tile")
+        return []
+
+    monkeypatch.setattr(llm_gemini, "extract_from_image", fake_extract)
+    rows = asyncio.run(llm_gemini._extract(image, None, "model"))
+
+    assert rows == [{"title": "Whole page"}]
+    assert events[0] == "whole"  # didn't wait for the slow sibling tiles
+
+
+def test_merge_rows_dedupes_seam_duplicates():
+    top = [
+        {"title": "CS 101", "days": "MWF", "start_time": "9:00AM", "end_time": "9:50AM"},
+        {"title": "MATH 200", "days": "TuTh", "start_time": "11:00AM", "end_time": "12:15PM"},
+    ]
+    bottom = [
+        {"title": "Math  200", "days": "Tu/Th", "start_time": "11:00", "end_time": "12:15PM",
+         "location": "Salazar Hall 232"},
+        {"title": "PHYS 150", "days": "F", "start_time": "1:00PM", "end_time": "3:45PM"},
+    ]
+    merged = merge_rows([top, bottom])
+    assert [r["title"] for r in merged] == ["CS 101", "MATH 200", "PHYS 150"]
+    assert merged[1]["location"] == "Salazar Hall 232"
+
+
+def test_merge_rows_only_folds_across_a_seam():
+    lab = {"title": "CHEM 101L", "days": "W", "start_time": "2:00PM", "end_time": "4:50PM"}
+    fall, spring = {**lab, "termLabel": "Fall 2025"}, {**lab, "termLabel": "Spring 2026"}
+    cs = {"title": "CS 101", "days": "MWF", "start_time": "9:00AM", "end_time": "9:50AM"}
+    phys = {"title": "PHYS 150", "days": "F", "start_time": "1:00PM", "end_time": "3:45PM"}
+    # The same lab twice within one tile, and again at the next tile's head
+    # under a different term: all three are real rows.
+    assert len(merge_rows([[fall, cs, fall], [spring, phys]])) == 5
+    assert len(merge_rows([[lab, cs, fall], [fall, phys]])) == 4
+    # Only the head of a tile that repeats the previous tail is folded.
+    merged = merge_rows([[fall, cs], [{**cs, "location": "Room 9"}, fall, phys], [cs]])
+    assert [r["title"] for r in merged] == ["CHEM 101L", "CS 101", "CHEM 101L", "PHYS 150", "CS 101"]
+    assert merged[1]["location"] == "Room 9"
@@ -289,6 +289,8 @@ export default function HomePage() {
       const response = await fetch(api("/extract-gemini"), {
         method: "POST",
         body: fd,
+        // session cookie: lets the backend reuse this browser's own earlier extractions
+        credentials: "include",
       });
 
       if (!response.ok) {